@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+json 与 orjson 序列化的基准测试：
+- 流式响应每个 chunk 生成 SSE 数据帧（只序列化、解析上游事件 + 序列化）的耗时
+- 非流式响应（100 条 1024 维 embedding）序列化的耗时
+
+在 code 目录下执行：python bench/bench_serializer.py [--iterations 200000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.apps.gateway.serializer import dumps, loads, sse_frame  # noqa: E402
+
+# 典型的思考模型推理内容 chunk
+DELTA_CHUNK = {
+    'id': 'chatcmpl-5f1c2d3e4b5a69788796a5b4c3d2e1f0', 'object': 'chat.completion.chunk', 'created': 1760000000,
+    'model': 'DeepSeek-R1',
+    'choices': [{'index': 0, 'delta': {'role': None, 'content': None, 'reasoning_content': '首先，我需要理解用户的问题'},
+                 'logprobs': None, 'finish_reason': None}],
+    'usage': None,
+}
+
+
+def json_frame(data: dict) -> bytes:
+    """
+    改用 orjson 之前的做法：json.dumps 拼接为字符串，由 starlette 编码为 bytes
+    """
+    return f'data: {json.dumps(data, ensure_ascii=False)}\n\n'.encode('utf-8')
+
+
+def embedding_body(count: int = 100, dims: int = 1024) -> dict:
+    rand = random.Random(0)
+    return {
+        'object': 'list', 'model': 'bge-m3',
+        'data': [{'object': 'embedding', 'index': i, 'embedding': [rand.uniform(-1, 1) for _ in range(dims)]}
+                 for i in range(count)],
+        'usage': {'prompt_tokens': count * 16, 'total_tokens': count * 16},
+    }
+
+
+def per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--iterations', type=int, default=200_000, help='每个 chunk 测试的执行次数')
+    args.add_argument('--body-iterations', type=int, default=20, help='非流式响应测试的执行次数')
+    args = args.parse_args()
+
+    raw = json_frame(DELTA_CHUNK)[len(b'data: '):-2]
+    assert loads(sse_frame(DELTA_CHUNK)[6:-2]) == json.loads(json_frame(DELTA_CHUNK)[6:-2])
+
+    print(f'per chunk ({args.iterations} iterations, python {sys.version.split()[0]}):')
+    old = per_call(lambda: json_frame(DELTA_CHUNK), args.iterations)
+    new = per_call(lambda: sse_frame(DELTA_CHUNK), args.iterations)
+    print(f'  serialize only:      json {old * 1e6:6.2f} us -> orjson {new * 1e6:6.2f} us')
+    old = per_call(lambda: json_frame(json.loads(raw)), args.iterations)
+    new = per_call(lambda: sse_frame(loads(raw)), args.iterations)
+    print(f'  parse + serialize:   json {old * 1e6:6.2f} us -> orjson {new * 1e6:6.2f} us')
+
+    body = embedding_body()
+    old = per_call(lambda: json.dumps(body, ensure_ascii=False).encode('utf-8'), args.body_iterations)
+    new = per_call(lambda: dumps(body), args.body_iterations)
+    print('non-stream body, 100 embeddings x 1024 floats:')
+    print(f'  json.dumps {old * 1e3:.1f} ms -> orjson {new * 1e3:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
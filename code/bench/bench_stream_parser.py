@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+流式对话响应解析的基准测试：生成思考模型的推理内容流（默认 10 万个 token），
+分别统计旧版解析器（从 git 中取出指定版本的 stream_parser.py）、当前解析器和透传解析器的耗时
+
+在 code 目录下执行：python bench/bench_stream_parser.py --old-rev <旧版本> [--tokens 100000]
+旧版本为修改解析器缓冲区之前的任意 git 版本（提交、分支或 tag），如 git log -- src/apps/gateway/stream_parser.py 中对应提交的父提交
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE_DIR)
+
+from src.apps.gateway import stream_parser  # noqa: E402
+from src.apps.gateway.protocol import ChatType  # noqa: E402
+
+PARSER_PATH = 'src/apps/gateway/stream_parser.py'
+
+
+def make_stream(tokens: int) -> bytes:
+    """
+    生成上游的 SSE 响应：每个 token 一个 reasoning_content 事件，最后是 finish_reason + usage 和 [DONE]
+    """
+    events = []
+    for i in range(tokens):
+        chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': 1, 'model': 'DeepSeek-R1',
+                 'choices': [{'index': 0, 'delta': {'reasoning_content': f'tok{i} '}, 'finish_reason': None}]}
+        events.append(f'data: {json.dumps(chunk)}\n\n'.encode())
+    usage = {'prompt_tokens': 1, 'completion_tokens': tokens, 'total_tokens': tokens + 1}
+    last = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': 1, 'model': 'DeepSeek-R1',
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+    events.append(f'data: {json.dumps(last)}\n\n'.encode())
+    events.append(b'data: [DONE]\n\n')
+    return b''.join(events)
+
+
+def load_old_parser(rev: str):
+    """
+    从 git 中取出旧版的解析器模块，与当前代码使用同一份 protocol / settings
+    """
+    source = subprocess.run(['git', 'show', f'{rev}:./{PARSER_PATH}'], cwd=CODE_DIR, check=True,
+                            capture_output=True).stdout
+    with tempfile.NamedTemporaryFile('wb', suffix='.py', delete=False) as f:
+        f.write(source)
+    try:
+        spec = importlib.util.spec_from_file_location('old_stream_parser', f.name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        os.unlink(f.name)
+    return module
+
+
+class FakeStream:
+    """
+    模拟 httpx 响应的 aiter_raw，按固定大小分块返回
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def aiter_raw(self, chunk_size: int):
+        for pos in range(0, len(self.data), chunk_size):
+            yield self.data[pos:pos + chunk_size]
+
+
+async def consume(parser, data: bytes) -> tuple[int, dict]:
+    lines, usage = 0, None
+    async for line in parser.parse(FakeStream(data)):
+        lines += 1
+        if line.type_ == ChatType.Usage:
+            usage = line.data['usage']
+    return lines, usage
+
+
+def run(name: str, parser, data: bytes):
+    start = time.perf_counter()
+    lines, usage = asyncio.run(consume(parser, data))
+    elapsed = time.perf_counter() - start
+    if isinstance(parser, stream_parser.PassthroughChatStreamResponseParser):
+        # 透传时内容只在客户端断开计费时才解析
+        parser._decode_regions()
+    print(f'{name:<28} {elapsed:8.2f}s  lines={lines} usage={usage} reasoning_len={len(parser.reasoning_content)}')
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    args.add_argument('--tokens', type=int, default=100_000, help='推理内容的 token（事件）数')
+    args.add_argument('--old-rev', required=True, help='旧版解析器所在的 git 版本')
+    args.add_argument('--chunk-sizes', default='1024,65536', help='读取上游响应的分块大小，逗号分隔')
+    args = args.parse_args()
+
+    data = make_stream(args.tokens)
+    print(f'stream: {args.tokens} tokens, {len(data) / 1024 / 1024:.1f} MB, python {sys.version.split()[0]}')
+    old = load_old_parser(args.old_rev)
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(',')]
+    for chunk_size in chunk_sizes:
+        run(f'old parser, chunk={chunk_size}', old.BaseChatStreamResponseParser(chunk_size), data)
+        run(f'new parser, chunk={chunk_size}', stream_parser.BaseChatStreamResponseParser(chunk_size), data)
+    chunk_size = max(chunk_sizes)
+    run(f'passthrough, chunk={chunk_size}', stream_parser.PassthroughChatStreamResponseParser(chunk_size), data)
+
+
+if __name__ == '__main__':
+    main()
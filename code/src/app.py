@@ -9,9 +9,11 @@ from http import HTTPStatus
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import Response
+from prometheus_client import generate_latest, REGISTRY
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import JSONResponse
 
+from src.apps.gateway.client_pool import upstream_clients
 from src.apps.gateway.api_file import api_router as gateway_api_file_router
 from src.apps.channel.api import api_channel_type_api_router as channel_type_api_router
 from src.apps.channel.api import admin_channel_type_api_router as channel_type_admin_router
@@ -24,6 +26,8 @@ from src.job.refresh_last_time_job import start as refresh_last_time_job_start
 from src.middlewares.logger import LoggerMiddleware
 from src.middlewares.user_loader import UserLoaderMiddleware
 from src.setting import settings
+from src.system.db.async_db import close_async_engine
+from src.system.integrations.cache.redis_client import async_redis_client
 
 
 @asynccontextmanager
@@ -33,8 +37,12 @@ async def lifespan(_app: FastAPI):
         asyncio.create_task(refresh_last_time_job_start())
         threading.Thread(target=event_manager.consume_event_msg, daemon=True).start()
     await limiter.refresh_all_limit()
+    upstream_clients.open()
     yield
     # 清理资源
+    await upstream_clients.close()
+    await async_redis_client.close()
+    await close_async_engine()
 
 
 app = FastAPI(
@@ -87,6 +95,12 @@ async def validation_exception_handler(request, exc: RequestValidationError):
         return await gateway_exception_handler(request, GatewayException(f'参数校验失败: {exc.errors()}', HTTPStatus.UNPROCESSABLE_ENTITY))
     return res_err(exc)
 
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    upstream_clients.refresh_metrics()
+    return Response(generate_latest(REGISTRY), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(gateway_api_file_router, prefix=settings.API_PREFIX)
 app.include_router(channel_type_api_router, prefix=settings.API_PREFIX)
 app.include_router(channel_type_admin_router, prefix=settings.API_PREFIX)
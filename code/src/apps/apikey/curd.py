@@ -3,7 +3,7 @@ from cachetools import TTLCache
 from typing import Union
 from pydantic import BaseModel
 
-from src.apps.base_curd import BaseCURD
+from src.apps.base_curd import AsyncBaseCURD
 from src.common.const.err_const import Err
 from src.common.asyncache import cached
 from src.common.const.comm_const import TTLTime, LAST_TIME_DIC, ResourceModule
@@ -18,7 +18,7 @@ from src.common.exceptions import MaaSBaseException
 from src.apps.apikey.req_schema import ApikeyLastTimeUpdate
 
 
-class ApiKeyCURD(BaseCURD[ApiKey]):
+class ApiKeyCURD(AsyncBaseCURD[ApiKey]):
 
     @session_manage()
     async def list_page(self, query_dto: QueryDTO) -> (list, int):
@@ -74,7 +74,7 @@ class ApiKeyCURD(BaseCURD[ApiKey]):
         """
         根据 id 查询令牌并缓存
         """
-        return await self.get_by_id(apikey_id)
+        return await self.aget_by_id(apikey_id)
 
 
 apikey_curd = ApiKeyCURD()
@@ -6,6 +6,7 @@ from pydantic import BaseModel
 from pydantic.schema import Generic
 from sqlalchemy import text, and_, func
 from sqlmodel import Session, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.common.const.comm_const import ModelT, DataOper, ResourceModule
 from src.common.const.err_const import Err
@@ -15,6 +16,7 @@ from src.common.dto import QueryDTO
 from src.common.exceptions import MaaSBaseException
 from src.common.req_schema import BasePageReq
 from src.common.utils.data import transform_to_model, get_primary_field
+from src.system.db.async_db import async_session_manage
 from src.system.db.sync_db import session_manage
 
 
@@ -166,4 +168,35 @@ class BaseCURD(Generic[ModelT]):
         return deleted_count > 0
 
 
+class AsyncBaseCURD(BaseCURD[ModelT]):
+    """
+    可选的异步数据库模式，网关链路上的查询继承该类，使用 asyncpg 避免阻塞事件循环
+    """
+
+    @property
+    def async_session(self) -> AsyncSession:
+        return Context.ASYNC_SESSION.get()
+
+    @async_session_manage()
+    async def aget_by_id(self, data_id: Union[int, str]) -> ModelT:
+        """
+        根据主键 id 查询数据
+        :param data_id: 主键id
+        :return: 单条数据 / None
+        """
+        return await self.async_session.get(self.ModelT, data_id)
+
+    @async_session_manage()
+    async def aquery_by_sql(self, sql_str: str, params=None) -> list[dict]:
+        """
+        执行自定义的 SQL 查询
+        :param sql_str: 自定义的 SQL 查询语句
+        :param params: 查询参数，例如 {"param_name": value}
+        :return: 查询结果
+        """
+        result = await self.async_session.execute(text(sql_str), params or {})
+        columns = result.keys()
+        return [dict(zip(columns, row)) for row in result.fetchall()]
+
+
 base_curd = BaseCURD()
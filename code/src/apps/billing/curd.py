@@ -14,7 +14,7 @@ from src.common.exceptions import GatewayException
 from src.common.loggers import logger
 from src.common.utils.data import date_to_utc_fmt
 from src.setting import settings
-from src.system.integrations.cache.redis_client import redis_client
+from src.system.integrations.cache.redis_client import redis_client, async_redis_client
 from src.system.integrations.logging.opensearch_client import opensearch_client
 from src.system.interface import PI
 
@@ -23,7 +23,7 @@ class BillingCURD(BaseCURD):
 
     # @cached(cache=TTLCache(maxsize=1024, ttl=TTLTime.BALANCE.value))
     @staticmethod
-    def valid_balance(user_id: str, model: str, unit: MetricUnit) -> bool:
+    async def valid_balance(user_id: str, model: str, unit: MetricUnit) -> bool:
         """
         校验用户余额
         数据缓存在 redis 和内存中，内存缓存2分钟，redis缓存10分钟
@@ -38,11 +38,11 @@ class BillingCURD(BaseCURD):
         prod_dto = prod_list[0]
 
         key = f'bal-enough:{user_id}:{model}'
-        bal_enough = redis_client.get(key)
+        bal_enough = await async_redis_client.get(key)
         if bal_enough is None:
             ret = PI.billing_interface.check_balance(user_id, prod_dto.model_category, model, prod_dto.token_type, 1, unit=unit)
             bal_enough = str(ret['ret_code'] == 0)
-            redis_client.set(key, bal_enough, ex=settings.EXP_TIME_BAL_ENOUGH)
+            await async_redis_client.set(key, bal_enough, ex=settings.EXP_TIME_BAL_ENOUGH)
         return bal_enough == Switch.ON
 
     @staticmethod
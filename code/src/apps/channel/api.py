@@ -73,7 +73,9 @@ async def update_channel(channel_id: str, channel_param: ChannelUpdate) -> BaseR
         model_redirection=channel_param.model_redirection,
         inference_secret_key=channel_param.inference_secret_key,
         inference_service=channel_param.inference_service,
-        status=channel_param.status
+        status=channel_param.status,
+        max_concurrency=channel_param.max_concurrency,
+        weight=channel_param.weight
     )
     if channel_param.model_redirection is None:
         channel_update_base.model_redirection = '{}'
@@ -140,6 +142,8 @@ async def list_channel(request: Request, queryDTO: QueryDTO = Depends(list_page)
             model_redirection=channelInfoItem.model_redirection,
             inference_secret_key=channelInfoItem.inference_secret_key,
             inference_service=channelInfoItem.inference_service,
+            max_concurrency=channelInfoItem.max_concurrency,
+            weight=channelInfoItem.weight,
             create_time=channelInfoItem.create_time,
             update_time=channelInfoItem.update_time,
             status=channelInfoItem.status,
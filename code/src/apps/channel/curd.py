@@ -6,7 +6,7 @@ import pydash
 from cachetools import TTLCache
 from httpx import AsyncClient, TimeoutException, RemoteProtocolError, ConnectError, RequestError
 
-from src.apps.base_curd import BaseCURD
+from src.apps.base_curd import BaseCURD, AsyncBaseCURD
 from src.apps.channel.req_schema import ChannelReq
 from src.apps.channel.rsp_schema import *
 from src.apps.metrics.curd import metrics_curd
@@ -47,7 +47,7 @@ MODEL_API = {
 }
 
 
-class ChannelCURD(BaseCURD[Channel]):
+class ChannelCURD(AsyncBaseCURD[Channel]):
 
     @session_manage()
     async def list_page(self, query_dto: QueryDTO) -> (list, int):
@@ -67,17 +67,17 @@ class ChannelCURD(BaseCURD[Channel]):
         """
         logger.info('加载模型渠道数据')
         sql = ("select t3.name, t1.id channel_id, t1.inference_secret_key, t1.inference_service, t1.health_status, "
-               "t1.model_redirection from channel t1 left join channel_to_model t2 on t1.id = t2.channel_id left join "
+               "t1.model_redirection, t1.max_concurrency, t1.weight from channel t1 left join channel_to_model t2 on t1.id = t2.channel_id left join "
                "model t3 on t2.model_id = t3.id where t1.status = 'active' and t3.status = 'active'")
-        ret = await self.query_by_sql(sql)
-        for channel in ret[0]:
+        ret = await self.aquery_by_sql(sql)
+        for channel in ret:
             if channel['model_redirection']:
                 try:
                     channel['model_redirection'] = json.loads(channel['model_redirection'])
                 except Exception:  # noqa
                     channel['model_redirection'] = None
                     logger.warning(f'解析渠道{channel["channel_id"]}的 model_redirection 失败: {channel["model_redirection"]}')
-        return pydash.group_by(ret[0], 'name')
+        return pydash.group_by(ret, 'name')
 
     async def health_check(self):
         logger.info('渠道健康检查')
@@ -133,7 +133,8 @@ class ChannelCURD(BaseCURD[Channel]):
         for ch in channels:
             if not ch.id:
                 ch.id = uuid(ResourceModule.CHANNEL)
-            channel = pydash.pick(ch.dict(), ["id", "name", "inference_secret_key", "inference_service"])
+            channel = pydash.pick(ch.dict(), ["id", "name", "inference_secret_key", "inference_service",
+                                              "max_concurrency", "weight"])
             channel.update({
                 "channel_type_id": "",
                 "model_redirection": json.dumps({model_name: ch.model_name}) if ch.model_name else '{}',
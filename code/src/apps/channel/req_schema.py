@@ -11,6 +11,8 @@ class ChannelCreate(BaseModel):
     model_redirection: Optional[str]
     inference_secret_key: str
     inference_service: str
+    max_concurrency: Optional[int] = Field(0, ge=0)
+    weight: Optional[int] = Field(1, ge=1)
 
 
 class ChannelUpdateBase(BaseModel):
@@ -20,6 +22,8 @@ class ChannelUpdateBase(BaseModel):
     inference_secret_key: Optional[str]
     inference_service: Optional[str]
     status: Optional[str]
+    max_concurrency: Optional[int] = Field(None, ge=0)
+    weight: Optional[int] = Field(None, ge=1)
 
 
 class ChannelUpdate(ChannelUpdateBase):
@@ -31,4 +35,6 @@ class ChannelReq(BaseModel):
     name: str = Field(..., min_length=2, max_length=32)
     inference_secret_key: Optional[str] = Field('', max_length=128)
     inference_service: str = Field(..., max_length=256)
-    model_name: Optional[str] = Field('', max_length=64)
\ No newline at end of file
+    model_name: Optional[str] = Field('', max_length=64)
+    max_concurrency: Optional[int] = Field(0, ge=0)
+    weight: Optional[int] = Field(1, ge=1)
\ No newline at end of file
@@ -24,6 +24,10 @@ class Channel(SQLModel, table=True):
     create_time: datetime
     status: str = Field(default=ChannelStatus.ACTIVE.value)
     health_status: Optional[int] = 1
+    # 集群内最大并发请求数，0 表示不限制
+    max_concurrency: Optional[int] = 0
+    # 容量权重，按权重分配流量
+    weight: Optional[int] = 1
 
 
 class ChannelType(SQLModel, table=True):
@@ -50,6 +54,8 @@ class ChannelInfo(BaseModel):
     model_redirection: Optional[str]
     inference_secret_key: str
     inference_service: str
+    max_concurrency: Optional[int] = 0
+    weight: Optional[int] = 1
     model: list[TypeInfo]
     update_time: datetime
     create_time: datetime
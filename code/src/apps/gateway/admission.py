@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Optional
+
+from src.apps.apikey.rsp_schema import ApiKey
+from src.apps.gateway.routing_table import ChannelRoute
+from src.apps.gateway.scheduler import FairQueue, Priority, request_priority
+from src.apps.metrics.curd import metrics_curd
+from src.common.exceptions import GatewayException
+from src.common.loggers import logger
+from src.setting import settings
+from src.system.integrations.cache.redis_client import async_redis_client
+
+REDIS_KEY_PREFIX = 'channel_inflight:'
+
+# 渠道并发租约：清理过期租约后，未达到上限时加入新租约
+# KEYS[1] 租约集合 ARGV: 当前时间, 租约过期时间, 租约 id, 并发上限, key 过期时间
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+# 续期进行中请求的租约，已释放（或已过期被清理）的租约不会重新加入
+# KEYS[1] 租约集合 ARGV: 租约过期时间, key 过期时间, 租约 id...
+RENEW_SCRIPT = """
+for i = 3, #ARGV do
+    redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+class AdmissionRejected(GatewayException):
+    """
+    渠道并发已满，排队已满或等待超时
+    """
+
+
+@dataclass
+class AdmissionTicket:
+    channel_id: str
+    # redis 租约 id，redis 不可用时为空，只按进程内并发限制
+    lease_id: Optional[str] = None
+
+
+class ChannelGate:
+    """
+    单个渠道的进程内并发控制：并发数达到上限时进入有界的等待队列，释放时按用户等级加权公平地移交给等待者
+    """
+
+    def __init__(self, channel_id: str):
+        self.channel_id = channel_id
+        self.inflight = 0
+        self.waiters = FairQueue()
+        # 等待中的请求数（进程内排队 + 等待集群租约）
+        self.queued = 0
+
+    def release(self):
+        waiter = self.waiters.pop()
+        if waiter is not None:
+            waiter.set_result(True)
+            return
+        self.inflight = max(self.inflight - 1, 0)
+
+
+class ChannelAdmission:
+    """
+    渠道并发准入：渠道配置了 max_concurrency 时，进程内信号量 + redis 租约共同限制集群内的并发请求数
+    超过上限的请求排队等待，队列已满时返回 429，等待超时返回 503
+    """
+
+    def __init__(self):
+        self._gates: dict[str, ChannelGate] = {}
+        # 各等级进程内排队中的请求数
+        self._priority_waiting: Counter = Counter()
+        # 本进程持有的租约：渠道 -> 租约 id，请求进行中定期续期
+        self._leases: dict[str, set[str]] = {}
+        self._renew_task: Optional[asyncio.Task] = None
+
+    def gate(self, channel_id: str) -> ChannelGate:
+        gate = self._gates.get(channel_id)
+        if gate is None:
+            gate = self._gates[channel_id] = ChannelGate(channel_id)
+        return gate
+
+    def _set_queued(self, gate: ChannelGate, delta: int):
+        gate.queued += delta
+        metrics_curd.submit_channel_queue(gate.channel_id, gate.queued)
+
+    async def acquire(self, channel: ChannelRoute, api_key_data: ApiKey = None) -> Optional[AdmissionTicket]:
+        limit = channel.max_concurrency
+        if not limit or limit <= 0:
+            return None
+
+        gate = self.gate(channel.channel_id)
+        start_time = time.monotonic()
+        deadline = start_time + settings.ADMISSION_QUEUE_TIMEOUT
+        priority = None
+        if gate.inflight >= limit or gate.waiters.waiting:
+            if gate.queued >= settings.ADMISSION_QUEUE_SIZE:
+                metrics_curd.submit_channel_rejected(channel.channel_id, 'queue_full')
+                raise AdmissionRejected('服务器繁忙，请稍后重试', HTTPStatus.TOO_MANY_REQUESTS)
+            priority = await request_priority(api_key_data)
+        # 查询优先级期间可能已经有空闲的并发数
+        if gate.inflight >= limit or gate.waiters.waiting:
+            await self._wait_local(gate, priority, deadline)
+        else:
+            gate.inflight += 1
+
+        try:
+            lease_id = await self._acquire_lease(gate, limit, deadline)
+        except BaseException:
+            gate.release()
+            raise
+        metrics_curd.submit_channel_queue_wait(channel.channel_id, time.monotonic() - start_time)
+        if lease_id:
+            self._hold_lease(channel.channel_id, lease_id)
+        return AdmissionTicket(channel.channel_id, lease_id)
+
+    def _set_priority_waiting(self, priority: Priority, delta: int):
+        self._priority_waiting[priority.level] += delta
+        metrics_curd.submit_scheduler_queue(priority.level, self._priority_waiting[priority.level])
+
+    async def _wait_local(self, gate: ChannelGate, priority: Priority, deadline: float):
+        waiter = asyncio.get_running_loop().create_future()
+        gate.waiters.push(priority, waiter)
+        self._set_queued(gate, 1)
+        self._set_priority_waiting(priority, 1)
+        start_time = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, max(deadline - start_time, 0))
+            metrics_curd.submit_scheduler_wait(priority.level, time.monotonic() - start_time)
+        except asyncio.TimeoutError:
+            metrics_curd.submit_channel_rejected(gate.channel_id, 'timeout')
+            metrics_curd.submit_scheduler_wait(priority.level, time.monotonic() - start_time)
+            raise AdmissionRejected('服务器繁忙，请稍后重试', HTTPStatus.SERVICE_UNAVAILABLE)
+        except asyncio.CancelledError:
+            # 取消前已经移交了并发数，转交给下一个等待者
+            if waiter.done() and not waiter.cancelled():
+                gate.release()
+            raise
+        finally:
+            self._set_queued(gate, -1)
+            self._set_priority_waiting(priority, -1)
+            gate.waiters.discard(priority)
+
+    async def _acquire_lease(self, gate: ChannelGate, limit: int, deadline: float) -> Optional[str]:
+        """
+        获取集群范围的并发租约，达到上限时轮询等待；租约持有期间定期续期，过期时间兜底进程异常退出未释放的情况
+        redis 不可用时降级为只按进程内并发限制
+        """
+        lease_id = uuid.uuid4().hex
+        key = f'{REDIS_KEY_PREFIX}{gate.channel_id}'
+        queued = False
+        try:
+            while True:
+                now = time.time()
+                try:
+                    acquired = await async_redis_client.eval_script(
+                        ACQUIRE_SCRIPT, [key], [now, now + settings.ADMISSION_LEASE_SECONDS, lease_id, limit,
+                                                settings.ADMISSION_LEASE_SECONDS])
+                except Exception as e:
+                    logger.warning(f'获取渠道[{gate.channel_id}]并发租约失败: {e}')
+                    return None
+                if acquired:
+                    return lease_id
+
+                if not queued:
+                    queued = True
+                    self._set_queued(gate, 1)
+                if time.monotonic() >= deadline:
+                    metrics_curd.submit_channel_rejected(gate.channel_id, 'timeout')
+                    raise AdmissionRejected('服务器繁忙，请稍后重试', HTTPStatus.SERVICE_UNAVAILABLE)
+                await asyncio.sleep(min(settings.ADMISSION_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        finally:
+            if queued:
+                self._set_queued(gate, -1)
+
+    def _hold_lease(self, channel_id: str, lease_id: str):
+        self._leases.setdefault(channel_id, set()).add(lease_id)
+        if self._renew_task is None or self._renew_task.done():
+            self._renew_task = asyncio.create_task(self._renew_leases())
+
+    async def _renew_leases(self):
+        """
+        租约过期时间只兜底进程异常退出的情况，持有期间每 1/3 个过期时间续期一次，
+        运行时间超过过期时间的请求（长时间的流式响应）不会被当作已结束而超发；没有持有的租约时退出
+        """
+        while self._leases:
+            await asyncio.sleep(settings.ADMISSION_LEASE_SECONDS / 3)
+            expire_at = time.time() + settings.ADMISSION_LEASE_SECONDS
+            for channel_id, lease_ids in list(self._leases.items()):
+                if not lease_ids:
+                    continue
+                try:
+                    await async_redis_client.eval_script(
+                        RENEW_SCRIPT, [f'{REDIS_KEY_PREFIX}{channel_id}'],
+                        [expire_at, settings.ADMISSION_LEASE_SECONDS, *lease_ids])
+                except Exception as e:
+                    logger.warning(f'续期渠道[{channel_id}]并发租约失败: {e}')
+
+    def release(self, ticket: Optional[AdmissionTicket]):
+        if ticket is None:
+            return
+        self.gate(ticket.channel_id).release()
+        if ticket.lease_id:
+            lease_ids = self._leases.get(ticket.channel_id)
+            if lease_ids is not None:
+                lease_ids.discard(ticket.lease_id)
+                if not lease_ids:
+                    del self._leases[ticket.channel_id]
+            asyncio.create_task(self._release_lease(ticket))
+
+    @staticmethod
+    async def _release_lease(ticket: AdmissionTicket):
+        try:
+            await async_redis_client.zrem(f'{REDIS_KEY_PREFIX}{ticket.channel_id}', ticket.lease_id)
+        except Exception as e:
+            logger.warning(f'释放渠道[{ticket.channel_id}]并发租约失败: {e}')
+
+
+channel_admission = ChannelAdmission()
@@ -1,113 +1,163 @@
 # -*- coding: utf-8 -*-
 import asyncio
-import re
+import random
 import time
 from http import HTTPStatus
+from typing import Type, Optional, Callable
 
+import httpx
 import pydash
-import tiktoken
-from fastapi import APIRouter, Request, Form, UploadFile, File, Response
+from fastapi import APIRouter, Request, Response
 from httpx import AsyncClient, TimeoutException, HTTPError
-from starlette.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
 from starlette.types import Receive
 
 from src.apps.apikey.rsp_schema import ApiKey
-from src.apps.channel.curd import channel_curd
+from src.apps.gateway.admission import channel_admission, AdmissionRejected, AdmissionTicket
+from src.apps.gateway.audio import (AudioFormat, AUDIO_MEDIA_TYPES, MAX_WAV_HEADER_BYTES, STREAM_DATA_SIZE, WavFormat,
+                                    wav_to_pcm)
+from src.apps.gateway.breaker import circuit_breakers
+from src.apps.gateway.client_pool import upstream_clients
 from src.apps.gateway.curd import validate_auth
+from src.apps.gateway.embedding_batcher import EmbeddingBatcher, EmbeddingResult
+from src.apps.gateway.embedding_cache import embedding_cache
+from src.apps.gateway.long_audio import AudioSegment, audio_layout, frame_energy, plan_segments, stitch_texts
+from src.apps.gateway.long_text import split_sentences
+from src.apps.gateway.multipart_upload import MultipartUpload, UpstreamBody, form_openapi
 from src.apps.gateway.protocol import ChatCompletionRequest, ChatType, CompletionRequest
+from src.apps.gateway.request_body import body_openapi, parse_body
 from src.apps.gateway.req_schema import TTSReq, EmbeddingsReq, RerankerReq
+from src.apps.gateway.rerank import shard_count, shard_documents, merge_results, sum_usage
+from src.apps.gateway.retry import UpstreamRetry, RetryDispatch, RETRY_STATUS, is_retryable
+from src.apps.gateway.router import select_channel, channel_loads, prompt_affinity_key
+from src.apps.gateway.routing_table import routing_tables, ChannelRoute
+from src.apps.gateway.response_cache import response_cache, CachedResponse, StreamRecorder
 from src.apps.gateway.rsp_schema import ModelsRsp, ModelInfo
-from src.apps.gateway.stream_parser import get_parser
+from src.apps.gateway.serializer import ORJSONResponse, sse_frame, dumps, loads, extract_field
+from src.apps.gateway.stream_parser import get_parser, is_think_model
+from src.apps.gateway.token_counter import token_encoder, count_prompt_tokens, count_in_executor
 from src.apps.model.curd import model_param_curd
 from src.apps.model.rsp_schema import ModelParam
 from src.apps.rate_limiter.limiter import limiter
-from src.common.const.comm_const import API_KEY_PREFIX, API_INVOKE_EVENT_QUEUE, ModelTag, MetricUnit, LANGUAGE, \
-    API_ERROR_EVENT_QUEUE
+from src.common.const.comm_const import API_INVOKE_EVENT_QUEUE, ModelTag, MetricUnit, LANGUAGE, API_ERROR_EVENT_QUEUE
 from src.common.context import Context
 from src.common.exceptions import GatewayException
 from src.common.loggers import logger
 from src.common.utils.data import date_to_utc_fmt, count_characters, replace_model
 from src.setting import settings
-from src.system.integrations.cache.redis_client import redis_client
+from src.system.integrations.cache.redis_client import async_redis_client
 
-api_router = APIRouter(prefix="/v1", tags=["推理服务接口"])
-token_encoder = tiktoken.get_encoding("o200k_base")
+api_router = APIRouter(prefix="/v1", tags=["推理服务接口"], default_response_class=ORJSONResponse)
 
 
 class ChatStreamingResponse(StreamingResponse):
 
-    def __init__(self, request: Request, url: str, headers: dict, body: dict, channel, api_key_data, proxy_model):
+    def __init__(self, request: Request, body: dict, channel, proxy_model, proxy_url, api_key_data, cache_key=None,
+                 affinity_key=None):
         self.model = body['model']
-        self.parser = get_parser(self.model)
+        # 需要补全 tool_calls 参数的请求不走透传
+        self.parser = get_parser(self.model, passthrough=settings.STREAM_PASSTHROUGH and not body.get('tools'))
         self.api_key_data = api_key_data
-        self.channel = channel
+        self.channel, self.proxy_model, self.proxy_url = channel, proxy_model, proxy_url
+        self.retry = UpstreamRetry(300)
+        self.cache_key = cache_key
+        self.affinity_key = affinity_key
+        self.recorder = StreamRecorder() if cache_key else None
         self.start_time = time.time()
         self.body_ = body
-        super().__init__(stream_response(request, url, headers, body, channel, api_key_data, proxy_model, self.parser),
-                         media_type='text/event-stream')
+        super().__init__(self.proxy_stream(request), media_type='text/event-stream')
+
+    async def proxy_stream(self, request: Request):
+        """
+        代理流式请求，返回首个数据前调用失败时换渠道重试
+        """
+        while True:
+            attempt_timeout = self.retry.next_attempt()
+            if self.retry.attempt > 1:
+                self.channel, self.proxy_model, self.proxy_url = await get_proxy_channel(
+                    request, self.model, api_key=self.api_key_data.id, exclude=self.retry.excluded,
+                    affinity_key=self.affinity_key)
+                self.parser.reset()
+            try:
+                async for line in stream_response(request, self.proxy_url, self.channel.headers, self.body_,
+                                                  self.channel, self.api_key_data, self.proxy_model, self.parser,
+                                                  self.retry, self.recorder, timeout=attempt_timeout):
+                    yield line
+            except RetryDispatch:
+                continue
+
+            # 正常结束的响应写入缓存
+            if self.recorder and self.recorder.usage and not self.recorder.failed:
+                asyncio.create_task(response_cache.set(self.cache_key, CachedResponse(
+                    self.channel.channel_id, self.recorder.usage, b''.join(self.recorder.frames), stream=True)))
+            return
 
     async def listen_for_disconnect(self, receive: Receive) -> None:
         while True:
             message = await receive()
             if message["type"] == "http.disconnect":
-                # 计算用量
-                prompt_str = ''.join((item.get('content') or '') for item in self.body_.get('messages', []))
-                prompt_tokens = len(token_encoder.encode(prompt_str))
-                completion_tokens = len(token_encoder.encode(self.parser.reasoning_content + self.parser.content))
-                usage = {
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": prompt_tokens + completion_tokens,
-                }
-                submit_api_invoke(self.model, self.channel, usage, self.api_key_data, ModelTag.CHAT, time.time() - self.start_time)
-                logger.warn(f'[{self.api_key_data.creator}]客户端主动断开连接: '
-                            f'{len(self.parser.reasoning_content)} / {len(self.parser.content)}')
+                # 计算用量放到独立任务中，不受响应任务组取消的影响
+                asyncio.create_task(self.submit_disconnect_usage(time.time() - self.start_time))
+                logger.warn(f'[{self.api_key_data.creator}]客户端主动断开连接: {self.parser.content_length}')
                 break
 
-
-async def get_proxy_channel(request :Request, model: str, api_key: str=None, req_path=None):
-    model_chanel_dict = await channel_curd.query_model_channel_and_cache()
-    if model not in model_chanel_dict:
+    async def submit_disconnect_usage(self, cost_time: float):
+        """
+        客户端断开时在线程池中计算用量并上报
+        """
+        prompt_tokens = await count_prompt_tokens(self.body_)
+        completion_tokens = await count_in_executor(self.parser.completion_tokens, token_encoder)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        submit_api_invoke(self.model, self.channel, usage, self.api_key_data, ModelTag.CHAT, cost_time)
+
+
+async def model_channels(model: str) -> tuple[ChannelRoute, ...]:
+    route = (await routing_tables.get()).get(model)
+    return route.channels if route else ()
+
+
+async def get_proxy_channel(request :Request, model: str, api_key: str=None, req_path=None, exclude: set[str] = None,
+                            affinity_key: str = None):
+    route = (await routing_tables.get()).get(model)
+    if not route:
         raise GatewayException(f"未找到模型[{model}]的渠道", HTTPStatus.BAD_REQUEST)
 
-    channels = model_chanel_dict.get(model)
-    healthy_channels = pydash.filter_(channels, 'health_status')
-    channels = healthy_channels if len(healthy_channels) else channels
-    if len(channels) == 1:
-        channel = channels[0]
-    elif api_key:
-        index = abs(hash(api_key)) % len(channels)
-        channel = channels[index]
-    else:
-        channel = pydash.sample(model_chanel_dict.get(model))
-
-    # 代理 model
-    proxy_model = channel['model_redirection'].get(model) if channel['model_redirection'] and model in channel['model_redirection'] else model
+    channels = route.candidates
+    if exclude or not all(circuit_breakers.available(item.channel_id) for item in route.channels):
+        # 排除本次请求中已经调用失败的渠道
+        channels = [item for item in route.channels if item.channel_id not in (exclude or ())]
+        if not channels:
+            raise GatewayException('服务器繁忙', HTTPStatus.SERVICE_UNAVAILABLE)
+        # 熔断中的渠道不分配流量，全部熔断时仍按健康状态选择
+        channels = [item for item in channels if circuit_breakers.available(item.channel_id)] or channels
+        channels = [item for item in channels if item.health_status] or channels
+    channel = select_channel(model, channels, api_key, affinity_key)
+    # 选中时即占用半开渠道的探测名额：流式请求在响应开始后才调用上游，并发请求不会都选中同一个半开渠道作为探测
+    circuit_breakers.on_request(channel.channel_id)
 
-    # 代理 url，逻辑：1. 以 '/' 结尾忽略 '/v1' 2. 以 '#' 结尾强制使用
-    proxy_host = channel.get('inference_service')
     req_path = (req_path or request.url.path.removeprefix(settings.API_PREFIX)).removeprefix('/v1')
-    if proxy_host.endswith('#'):
-        proxy_url = proxy_host[:-1]
-    elif proxy_host.endswith('/'):
-        proxy_url = proxy_host[:-1] + req_path
-    else:
-        proxy_url = proxy_host + '/v1' + req_path
-    return channel, proxy_model, proxy_url
+    return channel, channel.proxy_model, channel.url(req_path)
 
 
-def submit_api_invoke(model, channel, usage, api_key_data: ApiKey, model_tag: ModelTag, cost_time: float = 0):
+def submit_api_invoke(model, channel, usage, api_key_data: ApiKey, model_tag: ModelTag, cost_time: float = 0,
+                      cached=False):
     """
-    调用数据上报
+    调用数据上报，命中响应缓存时 channel 为缓存数据（记录了首次生成响应的渠道）
     """
     data = {
         'model': model,
-        'channel_id': channel['channel_id'],
+        'channel_id': channel.channel_id,
         'user_id': api_key_data.creator,
         'api_key': api_key_data.id,
         'model_tag': model_tag.value,
         'date_time': date_to_utc_fmt(),
         'cost_time': cost_time,
+        'cached': int(cached),
         'trace_id': Context.TRACE_ID.get() or '',
     }
     data.update({k: v for k, v in usage.items() if k != "prompt_tokens_details" and v is not None})
@@ -118,18 +168,42 @@ def submit_api_invoke(model, channel, usage, api_key_data: ApiKey, model_tag: Mo
         data["cached_tokens"] = cached_tokens
         data["prompt_tokens"] = input_tokens
     logger.info(f'[API INVOKE] {data}')
-    asyncio.create_task(redis_client.product_msg(API_INVOKE_EVENT_QUEUE, data))
+    asyncio.create_task(async_redis_client.product_msg(API_INVOKE_EVENT_QUEUE, data))
     asyncio.create_task(limiter.set_token_usage(api_key_data.creator, model, usage.get('total_tokens', 0)))
 
 
-def submit_http_error(model, channel, api_key_data, cost_time, e, stream=False):
+def submit_retry_recovered(model, channel, api_key_data, retry: UpstreamRetry, stream=False):
+    """
+    换渠道重试成功后上报，用于统计重试次数和重试带来的额外耗时
+    """
+    asyncio.create_task(async_redis_client.product_msg(API_ERROR_EVENT_QUEUE, {
+        'model': model,
+        'channel_id': channel.channel_id,
+        'user_id': api_key_data.creator,
+        'api_key': api_key_data.id,
+        'date_time': date_to_utc_fmt(),
+        'cost_time': time.time() - retry.start_time,
+        'retry_cost': retry.retry_cost,
+        'attempt': retry.attempt,
+        'outcome': 'recovered',
+        'err': '',
+        'message': '',
+        'stream': int(stream),
+        'trace_id': Context.TRACE_ID.get() or '',
+    }))
+    logger.info(f"[推理服务] [{channel.channel_id} {api_key_data.creator}]第[{retry.attempt}]次调用成功，"
+                f"重试耗时[{retry.retry_cost:.3f}]")
+
+
+def submit_http_error(model, channel, api_key_data, cost_time, e, stream=False, retry: UpstreamRetry = None,
+                      retrying=False):
     msg, code = '服务器繁忙', HTTPStatus.SERVICE_UNAVAILABLE
     except_name = type(e).__name__
     except_msg = str(e)
 
-    asyncio.create_task(redis_client.product_msg(API_ERROR_EVENT_QUEUE, {
+    asyncio.create_task(async_redis_client.product_msg(API_ERROR_EVENT_QUEUE, {
         'model': model,
-        'channel_id': channel['channel_id'],
+        'channel_id': channel.channel_id,
         'user_id': api_key_data.creator,
         'api_key': api_key_data.id,
         'date_time': date_to_utc_fmt(),
@@ -137,14 +211,20 @@ def submit_http_error(model, channel, api_key_data, cost_time, e, stream=False):
         'err': except_name,
         'message': except_msg,
         'stream': int(stream),
+        'attempt': retry.attempt if retry else 1,
+        'outcome': 'retry' if retrying else 'failed',
         'trace_id': Context.TRACE_ID.get() or '',
     }))
 
+    log_content = (f"[推理服务] [{channel.channel_id} {api_key_data.creator} {api_key_data.id} "
+                   f"{'stream' if stream else ''}]调用接口异常: [{except_name}][{except_msg}]")
+    if retrying:
+        logger.warning(f'{log_content}，第[{retry.attempt}]次调用失败，切换渠道重试')
+        return
+
     if isinstance(e, GatewayException) and not stream:
         raise e
 
-    log_content = (f"[推理服务] [{channel['channel_id']} {api_key_data.creator} {api_key_data.id} "
-                   f"{'stream' if stream else ''}]调用接口异常: [{except_name}][{except_msg}]")
     if isinstance(e, TimeoutException):
         msg, code = '请求超时', HTTPStatus.GATEWAY_TIMEOUT
     elif isinstance(e, HTTPError):
@@ -155,14 +235,70 @@ def submit_http_error(model, channel, api_key_data, cost_time, e, stream=False):
         raise GatewayException(msg, code)
 
 
+def raw_response(response) -> Response:
+    """
+    直接返回上游的响应数据，不做解析和重新序列化
+    """
+    return Response(content=response.content, media_type='application/json')
+
+
+class UpstreamStream:
+    """
+    流式读取的上游响应，读取结束（或客户端断开）时关闭，结束渠道负载和并发准入的统计
+    """
+
+    def __init__(self, response: httpx.Response, channel_id: str, ticket: Optional[AdmissionTicket]):
+        self.response = response
+        self.channel_id = channel_id
+        self.ticket = ticket
+        self.closed = False
+
+    @property
+    def headers(self) -> httpx.Headers:
+        return self.response.headers
+
+    def aiter_bytes(self):
+        return self.response.aiter_bytes()
+
+    def close(self):
+        """
+        同步结束统计，连接在后台关闭，响应任务被取消时也能执行
+        """
+        if self.closed:
+            return
+        self.closed = True
+        channel_loads.finish(self.channel_id)
+        channel_admission.release(self.ticket)
+        asyncio.create_task(self.response.aclose())
+
+
 async def http_client_send(client: AsyncClient, method, url, model, proxy_model, channel, api_key_data,
-                           headers=None, json_=None, data=None, files=None, timeout=10):
+                           headers=None, json_=None, data=None, files=None, timeout=10, retry: UpstreamRetry = None,
+                           stream=False, upload: UpstreamBody = None):
+    """
+    调用上游接口，stream 为 True 时只读取响应头，返回 UpstreamStream，由调用方读取数据后关闭
+    upload: 边读边转发的客户端上传数据，已经开始转发客户端连接上的数据后失败不再重试
+    """
+    if upload:
+        headers = {**(headers or {}), 'Content-Type': upload.content_type}
     start_time = time.time()
+    ticket = None
+    handed_off = False
+    channel_loads.start(channel.channel_id)
+    circuit_breakers.on_request(channel.channel_id)
     try:
-        response = await client.request(method, url, headers=headers, json=replace_model(json_, proxy_model),
-                                        data=replace_model(data, proxy_model), files=files, timeout=timeout)
+        # 渠道并发已满时排队，排队时间不计入上游耗时
+        ticket = await channel_admission.acquire(channel, api_key_data)
+        start_time = time.time()
+        upstream_request = client.build_request(method, url, headers=headers, json=replace_model(json_, proxy_model),
+                                                data=replace_model(data, proxy_model), files=files, content=upload,
+                                                timeout=timeout)
+        response = await client.send(upstream_request, stream=stream)
         code = response.status_code
         if code != 200:
+            if stream:
+                await response.aread()
+                await response.aclose()
             ret, msg = '', ''
             try:
                 ret = response.json()
@@ -171,48 +307,132 @@ async def http_client_send(client: AsyncClient, method, url, model, proxy_model,
                 pass
             logger.warning(f'[推理服务] 调用接口[{url}] 异常: [{code}][{ret}]')
             raise GatewayException(msg, code)
-        return response, time.time() - start_time
+        cost_time = time.time() - start_time
+        channel_loads.observe_ttft(channel.channel_id, cost_time)
+        circuit_breakers.record(channel.channel_id, failed=False)
+        if stream:
+            handed_off = True
+            return UpstreamStream(response, channel.channel_id, ticket), cost_time
+        return response, cost_time
     except Exception as e:
-        submit_http_error(model, channel, api_key_data, time.time() - start_time, e)
-
-
-async def stream_response(request: Request, url: str, headers: dict, body: dict, channel, api_key_data, proxy_model, parser):
+        cost_time = time.time() - start_time
+        # 准入排队被拒绝不是渠道故障，不计入熔断统计
+        circuit_breakers.record(channel.channel_id, failed=is_retryable(e) and not isinstance(e, AdmissionRejected))
+        replayable = not upload or upload.replayable
+        if retry and replayable and retry.can_retry(e, channel, await model_channels(model), cost_time):
+            submit_http_error(model, channel, api_key_data, cost_time, e, retry=retry, retrying=True)
+            raise RetryDispatch() from e
+        submit_http_error(model, channel, api_key_data, cost_time, e, retry=retry)
+    finally:
+        if not handed_off:
+            channel_loads.finish(channel.channel_id)
+            channel_admission.release(ticket)
+
+
+async def dispatch_send(request: Request, model, api_key_data, req_path=None, json_=None, data=None, files=None,
+                        timeout=10, prefer: ChannelRoute = None, affinity_key: str = None, stream=False,
+                        upload: UpstreamBody = None):
+    """
+    代理非流式请求，调用失败时排除失败的渠道，换渠道重试
+    prefer: 首次调用指定的渠道（需同时指定 req_path），重试时按路由策略选择
+    stream: 拿到响应头即返回 UpstreamStream（如音频数据），读取数据过程中失败不再重试
+    """
+    retry = UpstreamRetry(timeout)
+    while True:
+        attempt_timeout = retry.next_attempt()
+        if prefer and retry.attempt == 1:
+            channel, proxy_model, proxy_url = prefer, prefer.proxy_model, prefer.url(req_path.removeprefix('/v1'))
+        else:
+            channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id,
+                                                                      req_path=req_path, exclude=retry.excluded,
+                                                                      affinity_key=affinity_key)
+        client = upstream_clients.get(channel)
+        try:
+            response, cost_time = await http_client_send(client, request.method, proxy_url, model, proxy_model,
+                                                         channel, api_key_data, headers=channel.headers,
+                                                         json_=json_, data=data, files=files,
+                                                         timeout=attempt_timeout, retry=retry, stream=stream,
+                                                         upload=upload)
+        except RetryDispatch:
+            continue
+        if retry.attempt > 1:
+            submit_retry_recovered(model, channel, api_key_data, retry)
+        return channel, response, cost_time
+
+
+async def stream_response(request: Request, url: str, headers: dict, body: dict, channel, api_key_data, proxy_model,
+                          parser, retry: UpstreamRetry = None, recorder: StreamRecorder = None, timeout=300):
     """
-    代理流式请求
+    代理流式请求，返回首个数据前失败且可以重试时抛出 RetryDispatch
     """
     start_time = time.time()
+    yielded = False
+    ticket = None
+    channel_loads.start(channel.channel_id)
+    circuit_breakers.on_request(channel.channel_id)
     try:
+        ticket = await channel_admission.acquire(channel, api_key_data)
+        start_time = time.time()
         json = replace_model(body, proxy_model)
         json['stream_options'] = {"include_usage": True}
-        async with AsyncClient() as client:
-            async with client.stream(request.method, url, headers=headers, json=json, timeout=300) as stream:
-                async for content in parser.parse(stream):  # noqa
-                    if content.type_ == ChatType.Usage:
-                        # 业务数据（包含 choices）和 usage 在同一条，则正常返回，防止业务数据丢失
-                        if (content.data and content.data.get('choices')) or pydash.get(body, 'stream_options.include_usage'):
-                            yield content.content
-                        submit_api_invoke(body['model'], channel, content.data.get('usage'), api_key_data,
-                                          ModelTag.CHAT, time.time() - start_time)
-                    else:
+        client = upstream_clients.get(channel)
+        async with client.stream(request.method, url, headers=headers, json=json, timeout=timeout) as stream:
+            if stream.status_code in RETRY_STATUS:
+                await stream.aread()
+                logger.warning(f'[推理服务] 调用接口[{url}] 异常: [{stream.status_code}][{stream.text}]')
+                raise GatewayException('服务接口异常', stream.status_code)
+            async for content in parser.parse(stream):  # noqa
+                if not yielded:
+                    yielded = True
+                    channel_loads.observe_ttft(channel.channel_id, time.time() - start_time)
+                    circuit_breakers.record(channel.channel_id, failed=False)
+                    if retry and retry.attempt > 1:
+                        submit_retry_recovered(body['model'], channel, api_key_data, retry, stream=True)
+                if content.type_ == ChatType.Usage:
+                    # 业务数据（包含 choices）和 usage 在同一条，则正常返回，防止业务数据丢失
+                    if (content.data and content.data.get('choices')) or pydash.get(body, 'stream_options.include_usage'):
+                        if recorder:
+                            recorder.frames.append(content.content)
                         yield content.content
+                    if recorder:
+                        recorder.usage = content.data.get('usage')
+                    submit_api_invoke(body['model'], channel, content.data.get('usage'), api_key_data,
+                                      ModelTag.CHAT, time.time() - start_time)
+                else:
+                    if recorder:
+                        recorder.failed = recorder.failed or content.type_ == ChatType.Error
+                        recorder.frames.append(content.content)
+                    yield content.content
 
     except Exception as e:
-        submit_http_error(body['model'], channel, api_key_data, time.time() - start_time, e, stream=True)
-        yield 'data: {"id":"","object":"chat.completion.chunk","model":"' + body['model'] + '","choices":[{"index":0,"delta":{"role":null,"content":"服务器繁忙，请稍后再试。"},"finish_reason":"stop"}],"usage":null}\n\n'
+        cost_time = time.time() - start_time
+        circuit_breakers.record(channel.channel_id, failed=is_retryable(e) and not isinstance(e, AdmissionRejected))
+        if retry and not yielded and retry.can_retry(e, channel, await model_channels(body['model']), cost_time):
+            submit_http_error(body['model'], channel, api_key_data, cost_time, e, stream=True, retry=retry,
+                              retrying=True)
+            raise RetryDispatch() from e
+        submit_http_error(body['model'], channel, api_key_data, cost_time, e, stream=True, retry=retry)
+        if recorder:
+            recorder.failed = True
+        yield sse_frame({"id": "", "object": "chat.completion.chunk", "model": body['model'], "choices": [
+            {"index": 0, "delta": {"role": None, "content": "服务器繁忙，请稍后再试。"}, "finish_reason": "stop"}],
+            "usage": None})
+    finally:
+        channel_loads.finish(channel.channel_id)
+        channel_admission.release(ticket)
 
 
 @api_router.get("/models", description="查询用户可用的模型")
 async def models() -> ModelsRsp:
-    model_chanel_dict = await asyncio.create_task(channel_curd.query_model_channel_and_cache())
-    data = [ModelInfo(id=model) for model in model_chanel_dict.keys()]
+    routing_table = await routing_tables.get()
+    data = [ModelInfo(id=model) for model in routing_table.routes.keys()]
     return ModelsRsp(data=data)
 
 
-async def generate(request: Request):
-    body = await request.json()
+async def generate(request: Request, schema: Type[BaseModel]):
+    body = await parse_body(request, schema)
     model = body['model']
     api_key_data: ApiKey = await validate_auth(model, request, MetricUnit.TOKEN)
-    channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id)
 
     # 设置默认的 max_tokens
     param_dict = await model_param_curd.get_by_model_name(model)
@@ -221,29 +441,46 @@ async def generate(request: Request):
         body['max_tokens'] = int(param.value)
     body['max_tokens'] = min(body['max_tokens'], int(param.max))
 
-    headers = {'Authorization': API_KEY_PREFIX + channel.get('inference_secret_key')}
+    # 响应缓存
+    cache_key = response_cache.key(body, api_key_data) if response_cache.enabled(request, body) else None
+    if cache_key:
+        cached = await response_cache.get(cache_key, model)
+        if cached:
+            logger.info(f'[{api_key_data.creator}]命中响应缓存[{cache_key}]')
+            submit_api_invoke(model, cached, cached.usage, api_key_data, ModelTag.CHAT, cached=True)
+            if cached.stream:
+                return StreamingResponse(cached.frames(), media_type='text/event-stream')
+            return Response(content=cached.content, media_type='application/json')
+
+    affinity_key = prompt_affinity_key(model, body)
     if not body.get('stream'):
-        async with AsyncClient() as client:
-            response, cost_time = await http_client_send(client, request.method, proxy_url, model, proxy_model, channel,
-                                                         api_key_data, headers=headers, json_=body, timeout=300)
-            ret_data = response.json()
-            for expr in settings.THINK_MODELS.split(','):
-                if re.match(rf'^{expr}$', model):
-                    reasoning_content = pydash.get(ret_data, 'choices[0].message.reasoning_content') or ''
-                    content = pydash.get(ret_data, 'choices[0].message.content') or ''
-                    think_index = content.find('</think>')
-                    if not reasoning_content and think_index != -1:
-                        ret_data['choices'][0]['message']['reasoning_content'] = content[:think_index]
-                        ret_data['choices'][0]['message']['content'] = content[think_index + len('</think>'):]
-                    break
-
-            submit_api_invoke(body['model'], channel, ret_data.get('usage'), api_key_data, ModelTag.CHAT, cost_time)
-            return ret_data
-
-    return ChatStreamingResponse(request, proxy_url, headers, body, channel, api_key_data, proxy_model)
-
-@api_router.post("/chat/completions")
-async def chat(_: ChatCompletionRequest, request: Request):
+        channel, response, cost_time = await dispatch_send(request, model, api_key_data, json_=body, timeout=300,
+                                                           affinity_key=affinity_key)
+        # 只有思考模型需要拆分 reasoning_content，其他模型直接返回上游数据
+        if settings.UPSTREAM_RAW_PASSTHROUGH and not is_think_model(model):
+            content_bytes, usage = response.content, extract_field(response.content, 'usage') or {}
+        else:
+            ret_data = loads(response.content)
+            reasoning_content = pydash.get(ret_data, 'choices[0].message.reasoning_content') or ''
+            content = pydash.get(ret_data, 'choices[0].message.content') or ''
+            think_index = content.find('</think>')
+            if is_think_model(model) and not reasoning_content and think_index != -1:
+                ret_data['choices'][0]['message']['reasoning_content'] = content[:think_index]
+                ret_data['choices'][0]['message']['content'] = content[think_index + len('</think>'):]
+            content_bytes, usage = dumps(ret_data), ret_data.get('usage') or {}
+
+        submit_api_invoke(body['model'], channel, usage, api_key_data, ModelTag.CHAT, cost_time)
+        if cache_key:
+            asyncio.create_task(response_cache.set(cache_key, CachedResponse(channel.channel_id, usage, content_bytes)))
+        return Response(content=content_bytes, media_type='application/json')
+
+    channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id,
+                                                              affinity_key=affinity_key)
+    return ChatStreamingResponse(request, body, channel, proxy_model, proxy_url, api_key_data, cache_key=cache_key,
+                                 affinity_key=affinity_key)
+
+@api_router.post("/chat/completions", openapi_extra=body_openapi(ChatCompletionRequest))
+async def chat(request: Request):
     """
     大模型会话接口，支持流式和非流式
     {
@@ -259,24 +496,147 @@ async def chat(_: ChatCompletionRequest, request: Request):
                  "prompt_tokens_details": {"cached_tokens": 8}
                }
     }
+    请求体参数见 ChatCompletionRequest
     """
-    return await generate(request)
+    return await generate(request, ChatCompletionRequest)
 
 
-@api_router.post("/completions")
-async def completions(_: CompletionRequest, request: Request):
-    return await generate(request)
+@api_router.post("/completions", openapi_extra=body_openapi(CompletionRequest))
+async def completions(request: Request):
+    """
+    文本补全接口，请求体参数见 CompletionRequest
+    """
+    return await generate(request, CompletionRequest)
+
+
+class AudioStreamingResponse(StreamingResponse):
+    """
+    音频流式响应，响应结束或客户端在开始读取前断开时都关闭上游连接（及缓存的上传文件）
+    """
+
+    def __init__(self, content, close: Callable[[], None], media_type: str):
+        self.close = close
+        super().__init__(content, media_type=media_type)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.close()
+
+
+async def speech_stream(model: str, channel: ChannelRoute, upstream: UpstreamStream, api_key_data: ApiKey, words: int,
+                        start_time: float, response_format: AudioFormat):
+    """
+    边合成边返回音频数据，结束（或客户端断开）后按字符数上报用量，读取上游数据失败时不计费
+    """
+    failed = False
+    try:
+        chunks = upstream.aiter_bytes()
+        if response_format == AudioFormat.PCM:
+            chunks = wav_to_pcm(chunks)
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        failed = True
+        logger.warning(f'[推理服务] 渠道[{channel.channel_id}]读取 TTS 音频数据异常: {e}')
+    finally:
+        upstream.close()
+        if not failed:
+            submit_api_invoke(model, channel, {'words': words}, api_key_data, ModelTag.TTS, time.time() - start_time)
+
+
+async def segmented_speech_stream(request: Request, model: str, api_key_data: ApiKey, data: dict, segments: list[str],
+                                  upload: Optional[MultipartUpload], channels: list[ChannelRoute],
+                                  response_format: AudioFormat):
+    """
+    长文本按句子分段，轮流分配到模型的健康渠道并发合成，按顺序流式返回
+    只提前合成当前分段之后的 渠道数 - 1 个分段，限制缓存的音频数据；WAV 格式只返回一个文件头，数据长度未知，填最大值
+    按渠道上报各分段的字符数，合成失败的分段及之后未返回的分段不计费
+    """
+    start_time = time.time()
+    start = random.randrange(len(channels))
+    queues = [asyncio.Queue() for _ in segments]
+    formats: list[Optional[WavFormat]] = [None] * len(segments)
+    # 上游调用成功的渠道，用于计费
+    segment_channels: list[Optional[ChannelRoute]] = [None] * len(segments)
+    tasks: list[asyncio.Task] = []
+
+    async def synthesize(index: int):
+        queue = queues[index]
+
+        def on_format(fmt: WavFormat):
+            formats[index] = fmt
+
+        try:
+            segment_data = {**data, 'input': segments[index].strip()}
+            body = upload.body(segment_data, 'prompt_wav') if upload else None
+            channel, upstream, _ = await dispatch_send(request, model, api_key_data, req_path='/v1/audio/speech',
+                                                       data=None if body else segment_data, timeout=300, stream=True,
+                                                       upload=body, prefer=channels[(start + index) % len(channels)])
+            try:
+                segment_channels[index] = channel
+                async for chunk in wav_to_pcm(upstream.aiter_bytes(), on_format):
+                    queue.put_nowait(chunk)
+            finally:
+                upstream.close()
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    def launch(index: int):
+        if index < len(segments):
+            tasks.append(asyncio.create_task(synthesize(index)))
+
+    fmt, failed_index = None, None
+    try:
+        for index in range(len(channels)):
+            launch(index)
+        for index in range(len(segments)):
+            while (item := await queues[index].get()) is not None:
+                if isinstance(item, Exception):
+                    failed_index = index
+                    raise item
+                if fmt is None:
+                    fmt = formats[index]
+                    if response_format == AudioFormat.WAV:
+                        yield fmt.header(STREAM_DATA_SIZE)
+                elif formats[index] != fmt:
+                    failed_index = index
+                    raise GatewayException(f'分段音频格式不一致[{formats[index]}][{fmt}]', HTTPStatus.BAD_GATEWAY)
+                yield item
+            launch(index + len(channels))
+    except Exception as e:
+        logger.warning(f'[推理服务] TTS 第[{failed_index}]个分段合成异常: {e}')
+    finally:
+        for task in tasks:
+            task.cancel()
+        if upload:
+            upload.close()
+
+        channel_words: dict[str, tuple[ChannelRoute, int]] = {}
+        for index, channel in enumerate(segment_channels):
+            if channel and (failed_index is None or index < failed_index):
+                words = channel_words.get(channel.channel_id, (channel, 0))[1] + count_characters(segments[index])
+                channel_words[channel.channel_id] = (channel, words)
+        cost_time = time.time() - start_time
+        for channel, words in channel_words.values():
+            submit_api_invoke(model, channel, {'words': words}, api_key_data, ModelTag.TTS, cost_time)
 
 
 async def do_speech(request: Request, model: str, input: str, voice: str = '', prompt_text: str = '',
-                    prompt_wav: UploadFile = None, speed: float = 1.0):
+                    upload: MultipartUpload = None, speed: float = 1.0, response_format: str = AudioFormat.WAV):
     """
-    文字转语音接口逻辑
+    文字转语音接口逻辑，音频数据流式返回；upload 为携带参考音频 prompt_wav 的上传请求
     """
+    try:
+        response_format = AudioFormat(response_format or AudioFormat.WAV)
+    except ValueError:
+        # 兼容 OpenAI 客户端（默认 mp3），不支持的格式按 wav 返回
+        logger.warning(f'TTS 不支持的音频格式[{response_format}]，按 wav 返回')
+        response_format = AudioFormat.WAV
     api_key_data: ApiKey = await validate_auth(model, request, MetricUnit.WORDS)
-    channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id, req_path='/v1/audio/speech')
     speed = max(0.5, min(speed, 2))
-    headers = {'Authorization': API_KEY_PREFIX + channel.get('inference_secret_key')}
     data = {
         'input': input,
         'voice': voice,
@@ -284,72 +644,239 @@ async def do_speech(request: Request, model: str, input: str, voice: str = '', p
         'speed': speed,
         'trace_id': Context.TRACE_ID.get(),
     }
-    files = {}
-    if prompt_wav:
-        file_content = await prompt_wav.read()
-        files['prompt_wav'] = (prompt_wav.filename, file_content)
-
-    # 先不考虑流式场景
-    async with AsyncClient() as client:
-        response, cost_time = await http_client_send(client, request.method, proxy_url, model, proxy_model, channel,
-                                                     api_key_data, headers=headers, data=data, files=files, timeout=300)
-        speech_length = int(float(response.headers.get('speech-length', 0)))
-        words = count_characters(input)
-        logger.info(f'TTS 接口响应，语音时长[{speech_length}], 字符数[{words}]')
-        submit_api_invoke(model, channel, {'words': words}, api_key_data, ModelTag.TTS, cost_time)
-        return Response(content=response.content, media_type="audio/wav")
-
-
-@api_router.post("/audio/speech-ext")
-async def speech_ext(request: Request, model: str = Form(), input: str = Form(), voice: str = Form(''),
-                     prompt_text: str = Form(''), prompt_wav: UploadFile = File(None), speed: float = Form(1.0)):
-    return await do_speech(request, model, input, voice, prompt_text, prompt_wav, speed=speed)
+    if upload and upload.filename is None:
+        upload.close()
+        upload = None
+
+    segments = split_sentences(input, settings.TTS_SEGMENT_CHARS) if settings.TTS_SEGMENT_CHARS else [input]
+    if len(segments) > 1:
+        route = (await routing_tables.get()).get(model)
+        channels = [item for item in (route.healthy if route else ()) if circuit_breakers.available(item.channel_id)]
+        if channels:
+            logger.info(f'TTS 长文本分段合成，分段[{len(segments)}]渠道[{len(channels)}]字符数[{count_characters(input)}]')
+            return AudioStreamingResponse(
+                segmented_speech_stream(request, model, api_key_data, data, segments, upload, channels,
+                                        response_format),
+                upload.close if upload else lambda: None, AUDIO_MEDIA_TYPES[response_format])
+
+    body = None
+    if upload:
+        data, body = None, upload.body(data, 'prompt_wav')
+    start_time = time.time()
+    try:
+        channel, upstream, cost_time = await dispatch_send(request, model, api_key_data, req_path='/v1/audio/speech',
+                                                           data=data, timeout=300, stream=True, upload=body)
+    finally:
+        # 上游返回响应头时请求体已经发送完
+        if upload:
+            upload.close()
+    speech_length = int(float(upstream.headers.get('speech-length', 0)))
+    words = count_characters(input)
+    logger.info(f'TTS 接口响应，语音时长[{speech_length}], 字符数[{words}], 首包耗时[{cost_time:.2f}s]')
+    return AudioStreamingResponse(speech_stream(model, channel, upstream, api_key_data, words, start_time,
+                                                response_format), upstream.close, AUDIO_MEDIA_TYPES[response_format])
+
+
+@api_router.post("/audio/speech-ext", openapi_extra=form_openapi({
+    'model': {'type': 'string'},
+    'input': {'type': 'string'},
+    'voice': {'type': 'string', 'default': ''},
+    'prompt_text': {'type': 'string', 'default': ''},
+    'prompt_wav': {'type': 'string', 'format': 'binary'},
+    'speed': {'type': 'number', 'default': 1.0},
+    'response_format': {'type': 'string', 'enum': [item.value for item in AudioFormat],
+                        'default': AudioFormat.WAV.value},
+}, ['model', 'input']))
+async def speech_ext(request: Request):
+    upload = None
+    try:
+        if request.headers.get('content-type', '').startswith('application/x-www-form-urlencoded'):
+            fields = {key: value for key, value in (await request.form()).items() if isinstance(value, str)}
+        else:
+            # 参考音频较短，读完整个请求体后再调用上游，超过 1MB 的部分缓存到临时文件
+            upload = MultipartUpload(request, 'prompt_wav')
+            fields = await upload.read_fields(('model', 'input'), whole=True)
+        if not fields.get('model') or not fields.get('input'):
+            raise GatewayException('缺少参数[model, input]', HTTPStatus.BAD_REQUEST)
+        try:
+            speed = float(fields.get('speed') or 1.0)
+        except ValueError:
+            raise GatewayException(f'参数 speed 格式错误[{fields["speed"]}]', HTTPStatus.BAD_REQUEST)
+        # 缓存的参考音频由 do_speech 在发送完后关闭
+        return await do_speech(request, fields['model'], fields['input'], fields.get('voice', ''),
+                               fields.get('prompt_text', ''), upload, speed=speed,
+                               response_format=fields.get('response_format') or AudioFormat.WAV)
+    except Exception:
+        if upload:
+            upload.close()
+        raise
 
 
 @api_router.post("/audio/speech")
 async def speech(request: Request, tts_req: TTSReq):
-    return await do_speech(request, tts_req.model, tts_req.input, tts_req.voice, speed=tts_req.speed)
+    return await do_speech(request, tts_req.model, tts_req.input, tts_req.voice, speed=tts_req.speed,
+                           response_format=tts_req.response_format)
 
 
-@api_router.post("/audio/transcriptions")
-async def transcriptions(request: Request, model: str = Form(), file: UploadFile = File(None), lang: LANGUAGE = Form(
-    "auto", description="language of audio content")):
-    api_key_data: ApiKey = await validate_auth(model, request, MetricUnit.SECONDS)
-    channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id)
+async def transcribe_long_audio(request: Request, model: str, api_key_data: ApiKey, upload: MultipartUpload,
+                                lang: str) -> Optional[ORJSONResponse]:
+    """
+    长音频按静音（或固定时长）分段，轮流分配到模型的健康渠道并发识别，按顺序拼接识别结果
+    音频格式不支持分段、时长不需要分段或没有可用渠道时返回 None，按整段识别
+    """
+    try:
+        sample_rate = int(upload.fields.get('sample_rate') or 16000)
+    except ValueError:
+        raise GatewayException(f'参数 sample_rate 格式错误[{upload.fields["sample_rate"]}]', HTTPStatus.BAD_REQUEST)
+    layout = audio_layout(await upload.read_file(0, MAX_WAV_HEADER_BYTES), upload.filename, upload.file_content_type,
+                          sample_rate)
+    if not layout:
+        return None
+    route = (await routing_tables.get()).get(model)
+    channels = [item for item in (route.healthy if route else ()) if circuit_breakers.available(item.channel_id)]
+    if not channels:
+        return None
 
-    headers = {'Authorization': API_KEY_PREFIX + channel.get('inference_secret_key')}
-    file_content = await file.read()
-    files = {
-        'files': (file.filename, file_content),
-        'lang': (None, lang),
-    }
-    async with AsyncClient() as client:
-        response, cost_time = await http_client_send(client, request.method, proxy_url, model, proxy_model, channel,
-                                                     api_key_data, headers=headers, files=files, timeout=300)
+    start_time = time.time()
+    fmt, offset = layout
+    size = upload.file_size - offset
+    energy = await frame_energy(upload.read_file, fmt, offset, size)
+    segments = plan_segments(energy, fmt.sample_rate, size // fmt.block_align)
+    if len(segments) == 1:
+        return None
+
+    start = random.randrange(len(channels))
+    # 每个渠道同时只识别一个分段，同时也限制了读入内存的分段数据量
+    semaphore = asyncio.Semaphore(len(channels))
+
+    async def send_segment(index: int, segment: AudioSegment):
+        async with semaphore:
+            data = await upload.read_file(offset + segment.start * fmt.block_align, segment.frames * fmt.block_align)
+            files = {
+                'files': (f'segment-{index}.wav', fmt.header(len(data)) + data),
+                'lang': (None, lang),
+            }
+            channel, response, _ = await dispatch_send(request, model, api_key_data,
+                                                       req_path='/v1/audio/transcriptions', files=files,
+                                                       timeout=settings.ASR_SEGMENT_TIMEOUT,
+                                                       prefer=channels[(start + index) % len(channels)])
         ret_data = response.json()
-        if 'result' in ret_data and len(ret_data['result']) > 0:
-            speech_length = int(pydash.head(ret_data.get('audio_lengths')) or 0)
-            submit_api_invoke(model, channel, {'speech_length': speech_length}, api_key_data, ModelTag.ASR, cost_time)
-            logger.info(
-                f'ASR 接口响应，语音时长[{speech_length}], token 数量[{ret_data.get("result")[0].get("token_size")}]')
-            return JSONResponse({'text': ret_data.get('result')[0].get("text")})
+        text = (pydash.head(ret_data.get('result')) or {}).get('text') or ''
+        speech_length = float(pydash.head(ret_data.get('audio_lengths')) or 0) * segment.billed_ratio
+        return channel, text, speech_length
+
+    results = await asyncio.gather(*[send_segment(index, segment) for index, segment in enumerate(segments)],
+                                   return_exceptions=True)
+    responses = [item for item in results if not isinstance(item, BaseException)]
+
+    # 按渠道分别上报语音时长，部分分段失败时已识别完成的分段照常计费
+    channel_lengths: dict[str, tuple[ChannelRoute, float]] = {}
+    for channel, _, speech_length in responses:
+        total = channel_lengths.get(channel.channel_id, (channel, 0))[1]
+        channel_lengths[channel.channel_id] = (channel, total + speech_length)
+    cost_time = time.time() - start_time
+    for channel, speech_length in channel_lengths.values():
+        submit_api_invoke(model, channel, {'speech_length': round(speech_length)}, api_key_data, ModelTag.ASR,
+                          cost_time)
+    if len(responses) < len(results):
+        logger.warning(f'ASR 长音频分段识别，[{len(results) - len(responses)}/{len(results)}]个分段识别失败')
+        raise next(item for item in results if isinstance(item, BaseException))
+
+    text = stitch_texts([text for _, text, _ in responses], segments)
+    logger.info(f'ASR 长音频分段识别，分段[{len(segments)}]渠道[{len(channel_lengths)}]'
+                f'语音时长[{sum(item[1] for item in channel_lengths.values()):.0f}], 耗时[{cost_time:.2f}s]')
+    return ORJSONResponse({'text': text})
+
+
+@api_router.post("/audio/transcriptions", openapi_extra=form_openapi({
+    'model': {'type': 'string'},
+    'file': {'type': 'string', 'format': 'binary'},
+    'lang': {'type': 'string', 'enum': [item.value for item in LANGUAGE], 'default': LANGUAGE.auto.value,
+             'description': 'language of audio content'},
+    'long_audio': {'type': 'boolean', 'default': False,
+                   'description': '长音频分段并发识别，仅支持 16bit 的 WAV/PCM，需放在文件之前'},
+    'sample_rate': {'type': 'integer', 'default': 16000, 'description': 'PCM 音频的采样率'},
+}, ['model', 'file']))
+async def transcriptions(request: Request):
+    """
+    音频文件边读边转发给上游，model、lang 字段需放在文件之前，否则文件先缓存到临时文件
+    """
+    upload = MultipartUpload(request, 'file')
+    try:
+        fields = await upload.read_fields(('model',))
+        model = fields['model']
+        api_key_data: ApiKey = await validate_auth(model, request, MetricUnit.SECONDS)
+        if upload.filename is None:
+            raise GatewayException('缺少参数[file]', HTTPStatus.BAD_REQUEST)
+        # 分段识别需要完整的音频，读完整个请求体
+        long_audio = fields.get('long_audio', '').lower() in ('true', '1')
+        if long_audio:
+            await upload.read_fields(whole=True)
+
+        lang = None
+        if 'lang' in fields:
+            try:
+                lang = LANGUAGE(fields['lang'] or LANGUAGE.auto)
+            except ValueError:
+                raise GatewayException(f'不支持的语言[{fields["lang"]}]', HTTPStatus.BAD_REQUEST)
+        if long_audio:
+            response = await transcribe_long_audio(request, model, api_key_data, upload, (lang or LANGUAGE.auto).value)
+            if response:
+                return response
+
+        if lang:
+            body = upload.body({'lang': lang.value}, 'files')
         else:
-            return JSONResponse(ret_data)
+            # 客户端把 lang 放在文件之后时，由上游校验
+            body = upload.body({}, 'files', late_fields={'lang': LANGUAGE.auto.value})
+        channel, response, cost_time = await dispatch_send(request, model, api_key_data, timeout=300, upload=body)
+    finally:
+        upload.close()
+
+    ret_data = response.json()
+    if 'result' in ret_data and len(ret_data['result']) > 0:
+        speech_length = int(pydash.head(ret_data.get('audio_lengths')) or 0)
+        submit_api_invoke(model, channel, {'speech_length': speech_length}, api_key_data, ModelTag.ASR, cost_time)
+        logger.info(
+            f'ASR 接口响应，语音时长[{speech_length}], token 数量[{ret_data.get("result")[0].get("token_size")}]')
+        return ORJSONResponse({'text': ret_data.get('result')[0].get("text")})
+    else:
+        return ORJSONResponse(ret_data)
 
 
 async def common_proxy(model: str, request: Request, metric_unit: MetricUnit, model_tag: ModelTag, usage_field='usage',
-                       req_path=None, body=None):
+                       req_path=None, body=None, timeout=10):
     api_key_data: ApiKey = await validate_auth(model, request, metric_unit)
-    channel, proxy_model, proxy_url = await get_proxy_channel(request, model, api_key=api_key_data.id, req_path=req_path)
-    headers = {'Authorization': API_KEY_PREFIX + channel.get('inference_secret_key')}
     body = body or (await request.json())
-    async with AsyncClient() as client:
-        response, cost_time = await http_client_send(client, request.method, proxy_url, model, proxy_model, channel,
-                                                     api_key_data, headers=headers, json_=body, timeout=10)
-        ret_data = response.json()
-        logger.debug(f'[PROXY] 请求 [{proxy_url}][{body}]: {ret_data}')
-        submit_api_invoke(body['model'], channel, ret_data.get(usage_field, {}), api_key_data, model_tag, cost_time)
-        return ret_data
+    channel, response, cost_time = await dispatch_send(request, model, api_key_data, req_path=req_path, json_=body,
+                                                       timeout=timeout)
+    logger.debug(f'[PROXY] 请求 [{response.request.url}][{body}]: 响应长度[{len(response.content)}]')
+    if settings.UPSTREAM_RAW_PASSTHROUGH:
+        usage = extract_field(response.content, usage_field)
+        submit_api_invoke(body['model'], channel, usage or {}, api_key_data, model_tag, cost_time)
+        return raw_response(response)
+
+    ret_data = loads(response.content)
+    submit_api_invoke(body['model'], channel, ret_data.get(usage_field) or {}, api_key_data, model_tag, cost_time)
+    return ORJSONResponse(ret_data)
+
+
+async def dispatch_embeddings(request: Request, body: dict, api_key_data: ApiKey):
+    return await dispatch_send(request, body['model'], api_key_data, req_path='/v1/embeddings', json_=body,
+                               timeout=10)
+
+
+embedding_batcher = EmbeddingBatcher(dispatch_embeddings)
+
+
+async def forward_embeddings(request: Request, body: dict, api_key_data: ApiKey) -> EmbeddingResult:
+    """
+    转发 embeddings 请求，可以合并的并发请求合并为一次上游调用，按请求拆分结果和用量
+    """
+    if embedding_batcher.can_batch(body):
+        return await embedding_batcher.submit(request, body, api_key_data)
+    channel, response, cost_time = await dispatch_embeddings(request, body, api_key_data)
+    return EmbeddingResult(channel, extract_field(response.content, 'usage') or {}, response.content, cost_time)
 
 
 @api_router.post("/embeddings")
@@ -357,12 +884,59 @@ async def embeddings(req: EmbeddingsReq, request: Request):
     body = await request.json()
     if 'dimensions' in body:
         del body['dimensions']
-    return await common_proxy(req.model, request, MetricUnit.TOKEN, ModelTag.EMBEDDING, usage_field='usage', body=body)
+    api_key_data: ApiKey = await validate_auth(req.model, request, MetricUnit.TOKEN)
+    if embedding_cache.enabled(body):
+        result = await embedding_cache.embed(request, body, api_key_data, forward_embeddings)
+    else:
+        result = await forward_embeddings(request, body, api_key_data)
+    submit_api_invoke(body['model'], result.channel, result.usage, api_key_data, ModelTag.EMBEDDING, result.cost_time,
+                      cached=result.cached)
+    return Response(content=result.content, media_type='application/json')
 
 
 @api_router.post("/rerank")
-async def embeddings(req: RerankerReq, request: Request):
-    return await common_proxy(req.model, request, MetricUnit.TOKEN, ModelTag.RERANKER, usage_field='usage')
+async def rerank(req: RerankerReq, request: Request):
+    route = (await routing_tables.get()).get(req.model)
+    channels = [item for item in (route.healthy if route else ()) if circuit_breakers.available(item.channel_id)]
+    shards = shard_count(len(req.documents), len(channels))
+    if shards == 1:
+        return await common_proxy(req.model, request, MetricUnit.TOKEN, ModelTag.RERANKER, usage_field='usage',
+                                  timeout=settings.RERANK_TIMEOUT)
+
+    # 文档数较多时拆分为多个分片，轮流分配到健康的渠道并发调用，再合并为全局的 top_n
+    start_time = time.time()
+    api_key_data: ApiKey = await validate_auth(req.model, request, MetricUnit.TOKEN)
+    body = await request.json()
+    start = random.randrange(len(channels))
+
+    async def send_shard(index: int, documents: list[str]):
+        shard_body = {**body, 'documents': documents}
+        if body.get('top_n'):
+            shard_body['top_n'] = min(body['top_n'], len(documents))
+        channel, response, _ = await dispatch_send(request, req.model, api_key_data, req_path='/v1/rerank',
+                                                   json_=shard_body, timeout=settings.RERANK_TIMEOUT,
+                                                   prefer=channels[(start + index) % len(channels)])
+        return channel, loads(response.content)
+
+    parts = shard_documents(body['documents'], shards)
+    results = await asyncio.gather(*[send_shard(index, documents) for index, (_, documents) in enumerate(parts)],
+                                   return_exceptions=True)
+    responses = [item for item in results if not isinstance(item, BaseException)]
+
+    # 按渠道分别上报用量，部分分片失败时已完成的分片照常计费
+    channel_usages: dict[str, tuple[ChannelRoute, list[dict]]] = {}
+    for channel, data in responses:
+        channel_usages.setdefault(channel.channel_id, (channel, []))[1].append(data.get('usage'))
+    cost_time = time.time() - start_time
+    for channel, usages in channel_usages.values():
+        submit_api_invoke(req.model, channel, sum_usage(usages), api_key_data, ModelTag.RERANKER, cost_time)
+    if len(responses) < len(results):
+        logger.warning(f'rerank 分片调用，[{len(results) - len(responses)}/{len(results)}]个分片调用失败')
+        raise next(item for item in results if isinstance(item, BaseException))
+
+    ret_data = merge_results([(offset, data) for (offset, _), (_, data) in zip(parts, responses)], body.get('top_n'))
+    logger.debug(f'rerank 文档数[{len(req.documents)}]分片[{shards}]渠道[{len(channel_usages)}]')
+    return ORJSONResponse(ret_data)
 
 
 @api_router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import struct
+from dataclasses import dataclass
+from enum import Enum
+from http import HTTPStatus
+from typing import AsyncIterator, Callable, Optional
+
+from src.common.exceptions import GatewayException
+
+# 查找 WAV data 块时最多缓存的字节数
+MAX_WAV_HEADER_BYTES = 64 * 1024
+# 流式返回时总长度未知，WAV 头中的数据长度填最大值
+STREAM_DATA_SIZE = 0xFFFFFFFF - 36
+
+
+class AudioFormat(str, Enum):
+    WAV = "wav"
+    # 16bit little-endian 裸数据，没有文件头
+    PCM = "pcm"
+
+
+AUDIO_MEDIA_TYPES = {
+    AudioFormat.WAV: 'audio/wav',
+    AudioFormat.PCM: 'audio/pcm',
+}
+
+
+@dataclass
+class WavFormat:
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+
+    @classmethod
+    def parse(cls, fmt_chunk: bytes) -> 'WavFormat':
+        audio_format, channels, sample_rate, _, _, bits_per_sample = struct.unpack_from('<HHIIHH', fmt_chunk)
+        return cls(audio_format, channels, sample_rate, bits_per_sample)
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.bits_per_sample // 8
+
+    @property
+    def byte_rate(self) -> int:
+        return self.sample_rate * self.block_align
+
+    def header(self, data_size: int) -> bytes:
+        """
+        标准 44 字节 WAV 头
+        """
+        return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE' + b'fmt ' +
+                struct.pack('<IHHIIHH', 16, self.audio_format, self.channels, self.sample_rate, self.byte_rate,
+                            self.block_align, self.bits_per_sample) +
+                b'data' + struct.pack('<I', data_size))
+
+
+def parse_wav_header(data: bytes) -> Optional[tuple[WavFormat, int]]:
+    """
+    解析 WAV 头，返回 (音频格式, data 块数据的起始位置)，数据不足时返回 None
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise GatewayException('不支持的音频格式', HTTPStatus.BAD_REQUEST)
+
+    fmt, pos = None, 12
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack_from('<I', data, pos + 4)[0]
+        if chunk_id == b'data':
+            if fmt is None:
+                raise GatewayException('不支持的音频格式', HTTPStatus.BAD_REQUEST)
+            return fmt, pos + 8
+        if chunk_id == b'fmt ':
+            if pos + 8 + size > len(data):
+                return None
+            fmt = WavFormat.parse(data[pos + 8:pos + 8 + size])
+        pos += 8 + size + (size & 1)
+    return None
+
+
+async def wav_to_pcm(chunks: AsyncIterator[bytes],
+                     on_format: Callable[[WavFormat], None] = None) -> AsyncIterator[bytes]:
+    """
+    去掉 WAV 头，只返回音频数据；on_format 在解析出音频格式后、返回数据前调用
+    """
+    buffer = b''
+    header = None
+    async for chunk in chunks:
+        if header is not None:
+            yield chunk
+            continue
+        buffer += chunk
+        header = parse_wav_header(buffer)
+        if header is not None:
+            if on_format:
+                on_format(header[0])
+            if len(buffer) > header[1]:
+                yield buffer[header[1]:]
+            buffer = b''
+        elif len(buffer) > MAX_WAV_HEADER_BYTES:
+            raise GatewayException('不支持的音频格式', HTTPStatus.BAD_GATEWAY)
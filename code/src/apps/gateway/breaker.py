@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+from enum import IntEnum
+
+from src.apps.metrics.curd import metrics_curd
+from src.common.loggers import logger
+from src.setting import settings
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """
+    单个渠道的熔断器
+    关闭：统计窗口内错误率或连续失败次数超过阈值时熔断
+    打开：熔断时长内不分配流量，时长按连续熔断次数指数退避
+    半开：熔断时长结束后放行一个探测请求，成功则恢复，失败则再次熔断
+    """
+
+    def __init__(self, channel_id: str):
+        self.channel_id = channel_id
+        self.state = CircuitState.CLOSED
+        # 统计窗口内的调用结果 (时间, 是否失败)
+        self.outcomes: deque[tuple[float, bool]] = deque()
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe_since = 0.0
+
+    def _set_state(self, state: CircuitState):
+        if self.state != state:
+            logger.info(f'渠道[{self.channel_id}]熔断状态变更: {self.state.name} -> {state.name}')
+        self.state = state
+        metrics_curd.submit_circuit_state(self.channel_id, state)
+
+    def _trip(self, now: float):
+        self.trips += 1
+        open_seconds = min(settings.BREAKER_OPEN_SECONDS * 2 ** (self.trips - 1), settings.BREAKER_MAX_OPEN_SECONDS)
+        self.open_until = now + open_seconds
+        self.probe_since = 0.0
+        logger.warning(f'渠道[{self.channel_id}]熔断[{open_seconds}]秒，连续熔断次数[{self.trips}]')
+        self._set_state(CircuitState.OPEN)
+
+    def _reset(self):
+        self.outcomes.clear()
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.probe_since = 0.0
+        self._set_state(CircuitState.CLOSED)
+
+    def available(self) -> bool:
+        now = time.monotonic()
+        if self.state == CircuitState.OPEN:
+            if now < self.open_until:
+                return False
+            self._set_state(CircuitState.HALF_OPEN)
+        if self.state == CircuitState.HALF_OPEN:
+            # 同一时间只放行一个探测请求，探测请求没有结果时超时后再次放行
+            return not self.probe_since or now - self.probe_since > settings.BREAKER_PROBE_TIMEOUT
+        return True
+
+    def on_request(self):
+        """
+        选中渠道时以及调用上游时都会调用，半开状态下占用探测名额（重复调用只刷新探测开始时间）
+        """
+        if self.state == CircuitState.HALF_OPEN:
+            self.probe_since = time.monotonic()
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        if self.state == CircuitState.HALF_OPEN:
+            self._trip(now) if failed else self._reset()
+            return
+        if self.state == CircuitState.OPEN:
+            return
+
+        self.outcomes.append((now, failed))
+        self.failures += failed
+        self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+        while self.outcomes and self.outcomes[0][0] < now - settings.BREAKER_WINDOW:
+            self.failures -= self.outcomes.popleft()[1]
+
+        total = len(self.outcomes)
+        if self.consecutive_failures >= settings.BREAKER_CONSECUTIVE_FAILURES or \
+                (total >= settings.BREAKER_MIN_REQUESTS and self.failures / total >= settings.BREAKER_ERROR_RATE):
+            self.outcomes.clear()
+            self.failures = 0
+            self.consecutive_failures = 0
+            self._trip(now)
+
+
+class CircuitBreakerRegistry:
+    """
+    按 channel_id 维护熔断器，根据网关真实请求的结果判断渠道是否可用，比健康检查更快地摘除故障渠道
+    """
+
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, channel_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(channel_id)
+        if breaker is None:
+            breaker = self._breakers[channel_id] = CircuitBreaker(channel_id)
+        return breaker
+
+    def available(self, channel_id: str) -> bool:
+        return not settings.BREAKER_ENABLE or self.get(channel_id).available()
+
+    def on_request(self, channel_id: str):
+        if settings.BREAKER_ENABLE:
+            self.get(channel_id).on_request()
+
+    def record(self, channel_id: str, failed: bool):
+        if settings.BREAKER_ENABLE:
+            self.get(channel_id).record(failed)
+
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import ipaddress
+import socket
+import time
+from dataclasses import dataclass
+from importlib.util import find_spec
+
+import httpcore
+import httpx
+from httpx import AsyncClient
+
+from src.apps.gateway.routing_table import ChannelRoute
+from src.apps.metrics.curd import metrics_curd
+from src.common.loggers import logger
+from src.setting import settings
+
+# 渠道地址变更后，旧连接池延迟关闭的时间（秒），需大于最长的请求超时时间，保证进行中的请求不被中断
+RETIRE_DELAY = 330
+
+# 出现以下 trace 事件即表示请求已经从连接池中拿到连接（新建或复用）
+ACQUIRED_EVENTS = ('connection.connect_tcp.started', 'http11.send_request_headers.started',
+                   'http2.send_request_headers.started')
+
+
+class DNSCacheBackend(httpcore.AsyncNetworkBackend):
+    """
+    带 DNS 缓存的网络层，新建连接时不再重复解析域名
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._backend = httpcore.AnyIOBackend()
+        self._cache: dict[tuple[str, int], tuple[list[str], float]] = {}
+
+    async def _resolve(self, host: str, port: int) -> list[str]:
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        cached = self._cache.get((host, port))
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[(host, port)] = (addrs, time.monotonic() + self.ttl)
+        return addrs
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addrs = await self._resolve(host, port)
+        for index, addr in enumerate(addrs):
+            try:
+                return await self._backend.connect_tcp(addr, port, timeout=timeout, local_address=local_address,
+                                                       socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                # 所有地址都连不上时清理缓存，下次重新解析
+                if index == len(addrs) - 1:
+                    self._cache.pop((host, port), None)
+                    raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class PooledTransport(httpx.AsyncHTTPTransport):
+    """
+    统计连接池等待时间的 transport
+    """
+
+    def __init__(self, channel_id: str, network_backend: httpcore.AsyncNetworkBackend, **kwargs):
+        super().__init__(**kwargs)
+        self.channel_id = channel_id
+        # httpx 没有开放 network_backend 参数，直接替换连接池的网络层
+        self._pool._network_backend = network_backend
+
+    @property
+    def connections(self) -> list:
+        return self._pool.connections
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start_time = time.monotonic()
+        outer_trace = request.extensions.get('trace')
+        acquired = False
+
+        async def trace(event_name, info):
+            nonlocal acquired
+            if not acquired and event_name in ACQUIRED_EVENTS:
+                acquired = True
+                metrics_curd.submit_upstream_pool_wait(self.channel_id, time.monotonic() - start_time)
+            if outer_trace:
+                await outer_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+        return await super().handle_async_request(request)
+
+
+@dataclass
+class ChannelClient:
+    service: str
+    client: AsyncClient
+    transport: PooledTransport
+    max_connections: int
+
+
+class UpstreamClientRegistry:
+    """
+    推理服务 http 客户端注册表
+    按渠道复用长连接，避免每次请求都重新建立 TCP + TLS 连接，生命周期跟随应用 lifespan
+    """
+
+    def __init__(self):
+        self._clients: dict[str, ChannelClient] = {}
+        self._network_backend = None
+
+    def open(self):
+        logger.info('初始化推理服务连接池')
+        self._network_backend = DNSCacheBackend(settings.UPSTREAM_DNS_CACHE_TTL)
+
+    async def close(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for item in clients:
+            await item.client.aclose()
+        logger.info(f'关闭推理服务连接池[{len(clients)}]')
+
+    @staticmethod
+    def pool_conf(service: str) -> dict:
+        """
+        连接池配置，UPSTREAM_POOL_CONF 中按 inference_service 配置的优先
+        """
+        conf = {
+            'max_connections': settings.UPSTREAM_MAX_CONNECTIONS,
+            'max_keepalive_connections': settings.UPSTREAM_MAX_KEEPALIVE,
+            'keepalive_expiry': settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            'http2': settings.UPSTREAM_HTTP2,
+        }
+        conf.update(settings.UPSTREAM_POOL_CONF.get(service) or settings.UPSTREAM_POOL_CONF.get(service.rstrip('#/')) or {})
+        return conf
+
+    def _create(self, channel_id: str, service: str) -> ChannelClient:
+        if not self._network_backend:
+            self.open()
+
+        conf = self.pool_conf(service)
+        http2 = bool(conf['http2'])
+        if http2 and not find_spec('h2'):
+            logger.warning(f'渠道[{channel_id}]配置了 http2，但未安装 h2 依赖，降级为 http1.1')
+            http2 = False
+
+        limits = httpx.Limits(max_connections=conf['max_connections'],
+                              max_keepalive_connections=conf['max_keepalive_connections'],
+                              keepalive_expiry=conf['keepalive_expiry'])
+        transport = PooledTransport(channel_id, self._network_backend, http2=http2, limits=limits)
+        logger.info(f'创建渠道[{channel_id}][{service}]连接池: {conf}')
+        return ChannelClient(service, AsyncClient(transport=transport), transport, conf['max_connections'])
+
+    def get(self, channel: ChannelRoute) -> AsyncClient:
+        """
+        获取渠道对应的 http 客户端，渠道地址变更时重建连接池，旧连接池延迟关闭
+        """
+        channel_id, service = channel.channel_id, channel.inference_service
+        item = self._clients.get(channel_id)
+        if item and item.service == service:
+            return item.client
+
+        if item:
+            asyncio.get_running_loop().call_later(RETIRE_DELAY, lambda: asyncio.create_task(item.client.aclose()))
+        item = self._create(channel_id, service)
+        self._clients[channel_id] = item
+        return item.client
+
+    def refresh_metrics(self):
+        """
+        更新连接池占用指标
+        """
+        for channel_id, item in self._clients.items():
+            connections = item.transport.connections
+            idle = sum(1 for conn in connections if conn.is_idle())
+            metrics_curd.submit_upstream_pool(channel_id, len(connections) - idle, idle, item.max_connections)
+
+
+upstream_clients = UpstreamClientRegistry()
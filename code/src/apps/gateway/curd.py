@@ -38,7 +38,7 @@ async def validate_auth(model: str, request: Request, unit: Optional[MetricUnit]
     if api_key_data.status != ApiKeyStatus.ACTIVE:
         raise GatewayException("令牌未生效", HTTPStatus.UNAUTHORIZED)
 
-    if check_billing and not billing_curd.valid_balance(api_key_data.creator, model, unit):
+    if check_billing and not await billing_curd.valid_balance(api_key_data.creator, model, unit):
         raise GatewayException("账户余额不足", HTTPStatus.PAYMENT_REQUIRED)
 
     if check_limit and not await limiter.check_rpm_and_tpm_limit(api_key_data.creator, model):
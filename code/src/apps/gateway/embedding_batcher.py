@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request
+
+from src.apps.apikey.rsp_schema import ApiKey
+from src.apps.gateway.routing_table import ChannelRoute
+from src.apps.gateway.serializer import dumps, loads, extract_field
+from src.apps.metrics.curd import metrics_curd
+from src.common.exceptions import GatewayException
+from src.common.loggers import logger
+from src.setting import settings
+
+# 只有以下参数的请求可以合并，其他参数（如 dimensions）可能影响结果，单独转发
+BATCH_FIELDS = {'model', 'input', 'encoding_format', 'user'}
+
+
+@dataclass
+class EmbeddingResult:
+    channel: ChannelRoute
+    usage: dict
+    content: bytes
+    cost_time: float
+    # 全部命中 embedding 缓存，未调用上游
+    cached: bool = False
+
+
+@dataclass
+class BatchCaller:
+    start: int
+    count: int
+    # 拆分 usage 的权重：文本为字符数，token 数组为 token 数
+    weight: int
+    future: asyncio.Future
+
+
+class BatchFailed(Exception):
+    """
+    合并的上游调用失败，请求改为单独调用上游
+    """
+
+
+@dataclass
+class PendingBatch:
+    request: Request
+    api_key_data: ApiKey
+    params: dict
+    # 第一个请求的上下文（trace_id），合并调用在该上下文中执行
+    context: contextvars.Context
+    inputs: list = field(default_factory=list)
+    callers: list[BatchCaller] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, inputs: list, weight: int, future: asyncio.Future):
+        self.callers.append(BatchCaller(len(self.inputs), len(inputs), weight, future))
+        self.inputs.extend(inputs)
+
+
+def normalize_input(value) -> tuple[Optional[list], str]:
+    """
+    统一为输入列表，返回 (输入列表, 类型)，类型为 text 或 tokens，不支持的格式返回 None
+    """
+    if isinstance(value, str):
+        return [value], 'text'
+    if isinstance(value, list) and value:
+        if all(isinstance(item, str) for item in value):
+            return value, 'text'
+        if all(isinstance(item, int) for item in value):
+            return [value], 'tokens'
+        if all(isinstance(item, list) for item in value):
+            return value, 'tokens'
+    return None, ''
+
+
+def split_tokens(total: int, weights: list[int]) -> list[int]:
+    """
+    按权重拆分 token 数，保证拆分后的总数与上游返回的一致（最大余数法）
+    """
+    weights = [max(weight, 1) for weight in weights]
+    weight_sum = sum(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    ret = [int(share) for share in shares]
+    remainders = sorted(range(len(shares)), key=lambda i: shares[i] - ret[i], reverse=True)
+    for i in remainders[:total - sum(ret)]:
+        ret[i] += 1
+    return ret
+
+
+class EmbeddingBatcher:
+    """
+    embeddings 请求合并：同一模型、同一令牌的并发请求在几毫秒的窗口内（或输入数达到上限时）合并为一次上游调用，
+    再按请求拆分 data 和 usage，每个请求仍单独上报调用数据
+    只合并同一令牌的请求，渠道准入的排队优先级与各请求单独调用时一致，拆分后的 usage 总数按令牌计费也与上游一致
+    合并调用失败时各请求单独调用上游，错误按请求返回和上报，不会因为其他请求的输入导致失败
+    """
+
+    def __init__(self, send: Callable[[Request, dict, ApiKey], Awaitable[tuple[ChannelRoute, Any, float]]]):
+        self.send = send
+        self._pending: dict[tuple, PendingBatch] = {}
+
+    @staticmethod
+    def can_batch(body: dict) -> bool:
+        if not settings.EMBEDDING_BATCH_ENABLE or set(body) - BATCH_FIELDS:
+            return False
+        inputs, _ = normalize_input(body.get('input'))
+        return inputs is not None and len(inputs) < settings.EMBEDDING_BATCH_MAX_INPUTS
+
+    async def submit(self, request: Request, body: dict, api_key_data: ApiKey) -> EmbeddingResult:
+        inputs, kind = normalize_input(body['input'])
+        key = (body['model'], body.get('encoding_format') or 'float', kind, api_key_data.creator, api_key_data.id)
+        batch = self._pending.get(key)
+        if batch and len(batch.inputs) + len(inputs) > settings.EMBEDDING_BATCH_MAX_INPUTS:
+            self._flush(key, batch)
+            batch = None
+        if batch is None:
+            params = {k: v for k, v in body.items() if k not in ('input', 'user')}
+            batch = self._pending[key] = PendingBatch(request, api_key_data, params, contextvars.copy_context())
+            batch.timer = asyncio.get_running_loop().call_later(settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+                                                                self._flush, key, batch)
+
+        future = asyncio.get_running_loop().create_future()
+        weight = sum(len(item) for item in inputs)
+        batch.add(inputs, weight, future)
+        if len(batch.inputs) >= settings.EMBEDDING_BATCH_MAX_INPUTS:
+            self._flush(key, batch)
+        try:
+            return await future
+        except BatchFailed:
+            channel, response, cost_time = await self.send(request, body, api_key_data)
+            return EmbeddingResult(channel, extract_field(response.content, 'usage') or {}, response.content, cost_time)
+
+    def _flush(self, key: tuple, batch: PendingBatch):
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        batch.timer.cancel()
+        # 输入数达到上限时由后加入的请求触发，上游调用仍在第一个请求的上下文中执行
+        batch.context.run(asyncio.create_task, self._send(batch))
+
+    async def _send(self, batch: PendingBatch):
+        model = batch.params['model']
+        metrics_curd.submit_embedding_batch(model, len(batch.callers), len(batch.inputs))
+        try:
+            channel, response, cost_time = await self.send(batch.request, {**batch.params, 'input': batch.inputs},
+                                                           batch.api_key_data)
+            results = self.split(batch, channel, response.content, cost_time)
+        except Exception as e:
+            if len(batch.callers) > 1:
+                logger.warning(f'embeddings 合并请求[{len(batch.callers)}]调用失败，改为单独调用: {e}')
+                e = BatchFailed()
+            for caller in batch.callers:
+                if not caller.future.done():
+                    caller.future.set_exception(e)
+            return
+
+        for caller, result in zip(batch.callers, results):
+            if not caller.future.done():
+                caller.future.set_result(result)
+
+    @staticmethod
+    def split(batch: PendingBatch, channel: ChannelRoute, content: bytes, cost_time: float) -> list[EmbeddingResult]:
+        """
+        按请求拆分上游响应，只有一个请求时直接返回上游数据
+        """
+        if len(batch.callers) == 1:
+            return [EmbeddingResult(channel, extract_field(content, 'usage') or {}, content, cost_time)]
+
+        ret_data = loads(content)
+        items = sorted(ret_data.get('data') or [], key=lambda item: item.get('index', 0))
+        if len(items) != len(batch.inputs):
+            logger.warning(f'embeddings 合并请求返回数量[{len(items)}]与输入数量[{len(batch.inputs)}]不一致')
+            raise GatewayException('服务接口异常', HTTPStatus.BAD_GATEWAY)
+
+        usage = ret_data.get('usage') or {}
+        weights = [caller.weight for caller in batch.callers]
+        prompt_tokens = split_tokens(usage.get('prompt_tokens') or 0, weights)
+        total_tokens = split_tokens(usage.get('total_tokens') or 0, weights)
+        results = []
+        for i, caller in enumerate(batch.callers):
+            data = [{**item, 'index': index} for index, item in enumerate(items[caller.start:caller.start + caller.count])]
+            caller_usage = {'prompt_tokens': prompt_tokens[i], 'total_tokens': total_tokens[i]}
+            body = {'object': ret_data.get('object', 'list'), 'data': data, 'model': ret_data.get('model'),
+                    'usage': caller_usage}
+            results.append(EmbeddingResult(channel, caller_usage, dumps(body), cost_time))
+        logger.debug(f'embeddings 合并请求[{len(batch.callers)}]输入数[{len(batch.inputs)}]')
+        return results
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import base64
+import hashlib
+import re
+import struct
+import time
+from array import array
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Awaitable, Callable, Optional
+
+from cachetools import LRUCache
+from fastapi import Request
+
+from src.apps.apikey.rsp_schema import ApiKey
+from src.apps.gateway.embedding_batcher import EmbeddingResult, BATCH_FIELDS, normalize_input, split_tokens
+from src.apps.gateway.serializer import dumps, loads
+from src.apps.metrics.curd import metrics_curd
+from src.common.exceptions import GatewayException
+from src.common.loggers import logger
+from src.setting import settings
+from src.system.integrations.cache.redis_client import async_redis_client
+
+REDIS_KEY_PREFIX = 'embedding_cache:'
+# 缓存数据头：token 数、渠道 id 长度
+ENTRY_HEADER = struct.Struct('<IH')
+
+
+@dataclass
+class CacheEntry:
+    # 首次生成向量的渠道，全部命中缓存时按该渠道上报调用数据
+    channel_id: str
+    # 该文本的 token 数（由上游返回的 usage 按文本长度拆分）
+    tokens: int
+    # float32 向量
+    vector: bytes
+
+    def encode(self) -> bytes:
+        channel_id = self.channel_id.encode('utf-8')
+        return ENTRY_HEADER.pack(self.tokens, len(channel_id)) + channel_id + self.vector
+
+    @classmethod
+    def decode(cls, value: bytes) -> 'CacheEntry':
+        tokens, length = ENTRY_HEADER.unpack_from(value)
+        start = ENTRY_HEADER.size
+        return cls(value[start:start + length].decode('utf-8'), tokens, value[start + length:])
+
+    def embedding(self, encoding_format: str):
+        if encoding_format == 'base64':
+            return base64.b64encode(self.vector).decode('ascii')
+        return array('f', self.vector).tolist()
+
+
+def to_vector(embedding) -> bytes:
+    """
+    上游返回的向量转为 float32 字节，base64 格式本身就是 float32 数据
+    """
+    if isinstance(embedding, str):
+        return base64.b64decode(embedding)
+    return array('f', embedding).tobytes()
+
+
+class EmbeddingCache:
+    """
+    embedding 按文本缓存，key 为 (模型, 文本 sha256, dimensions)，不同用户之间共享
+    两级：进程内 LRU + redis，请求中只有未命中的文本转发到上游，计费只统计上游实际处理的 token
+    """
+
+    def __init__(self):
+        self._memory = LRUCache(maxsize=settings.EMBEDDING_CACHE_MEMORY_BYTES, getsizeof=len)
+        self._model_exprs = [expr for expr in settings.EMBEDDING_CACHE_MODELS.split(',') if expr]
+
+    def enabled(self, body: dict) -> bool:
+        if not self._model_exprs or set(body) - BATCH_FIELDS:
+            return False
+        _, kind = normalize_input(body.get('input'))
+        return kind == 'text' and any(re.match(rf'^{expr}$', body['model']) for expr in self._model_exprs)
+
+    @staticmethod
+    def key(model: str, text: str, dimensions: Optional[int]) -> str:
+        return f"{model}:{dimensions or ''}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    async def get_many(self, keys: list[str]) -> tuple[dict[str, CacheEntry], int]:
+        """
+        批量查询，返回命中的数据和其中 redis 命中的数量
+        """
+        ret = {}
+        for key in keys:
+            value = self._memory.get(key)
+            if value is not None:
+                ret[key] = CacheEntry.decode(value)
+
+        missing = [key for key in keys if key not in ret]
+        if not missing or not settings.EMBEDDING_CACHE_REDIS:
+            return ret, 0
+        try:
+            values = await async_redis_client.mget_bytes([f'{REDIS_KEY_PREFIX}{key}' for key in missing])
+        except Exception as e:
+            logger.warning(f'读取 embedding 缓存失败: {e}')
+            return ret, 0
+
+        hits = 0
+        for key, value in zip(missing, values):
+            if value:
+                self._set_memory(key, value)
+                ret[key] = CacheEntry.decode(value)
+                hits += 1
+        return ret, hits
+
+    def _set_memory(self, key: str, value: bytes):
+        try:
+            self._memory[key] = value
+        except ValueError:
+            # 超过内存缓存总大小
+            pass
+
+    async def set_many(self, entries: dict[str, CacheEntry]):
+        values = {key: entry.encode() for key, entry in entries.items()}
+        for key, value in values.items():
+            self._set_memory(key, value)
+        if settings.EMBEDDING_CACHE_REDIS:
+            try:
+                await async_redis_client.mset_bytes({f'{REDIS_KEY_PREFIX}{key}': value for key, value in values.items()},
+                                                    ex=settings.EMBEDDING_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f'写入 embedding 缓存失败: {e}')
+
+    async def embed(self, request: Request, body: dict, api_key_data: ApiKey,
+                    forward: Callable[[Request, dict, ApiKey], Awaitable[EmbeddingResult]]) -> EmbeddingResult:
+        """
+        先查缓存，未命中的文本（去重后）转发到上游，再按原始顺序组装响应
+        """
+        start_time = time.time()
+        model, encoding_format = body['model'], body.get('encoding_format') or 'float'
+        texts, _ = normalize_input(body['input'])
+        keys = [self.key(model, text, body.get('dimensions')) for text in texts]
+        entries, redis_hits = await self.get_many(keys)
+        cached_count = sum(1 for key in keys if key in entries)
+        # 命中缓存的 token 数不包含本次上游处理的文本
+        cached_tokens = sum(entries[key].tokens for key in keys if key in entries)
+
+        misses = {key: text for key, text in zip(keys, texts) if key not in entries}
+        result = None
+        if misses:
+            result = await forward(request, {**body, 'input': list(misses.values())}, api_key_data)
+            entries.update(self.parse_upstream(result, misses))
+
+        metrics_curd.submit_embedding_cache(model, cached_count - redis_hits, redis_hits, len(keys) - cached_count,
+                                            cached_tokens)
+        data = [{'object': 'embedding', 'index': index, 'embedding': entries[key].embedding(encoding_format)}
+                for index, key in enumerate(keys)]
+        usage = {'prompt_tokens': 0, 'total_tokens': 0}
+        if result:
+            usage = {'prompt_tokens': result.usage.get('prompt_tokens') or 0,
+                     'total_tokens': result.usage.get('total_tokens') or 0}
+        content = dumps({'object': 'list', 'data': data, 'model': model, 'usage': usage})
+        usage['cached_tokens'] = cached_tokens
+        if result:
+            return EmbeddingResult(result.channel, usage, content, result.cost_time)
+        return EmbeddingResult(entries[keys[0]], usage, content, time.time() - start_time, cached=True)
+
+    def parse_upstream(self, result: EmbeddingResult, misses: dict[str, str]) -> dict[str, CacheEntry]:
+        """
+        解析上游响应，按文本长度拆分 token 数后写入缓存
+        """
+        items = sorted(loads(result.content).get('data') or [], key=lambda item: item.get('index', 0))
+        if len(items) != len(misses):
+            logger.warning(f'embeddings 返回数量[{len(items)}]与输入数量[{len(misses)}]不一致')
+            raise GatewayException('服务接口异常', HTTPStatus.BAD_GATEWAY)
+
+        tokens = split_tokens(result.usage.get('total_tokens') or 0, [len(text) for text in misses.values()])
+        entries = {key: CacheEntry(result.channel.channel_id, count, to_vector(item['embedding']))
+                   for key, count, item in zip(misses, tokens, items)}
+        asyncio.create_task(self.set_many(entries))
+        return entries
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from src.apps.gateway.audio import WavFormat, parse_wav_header, MAX_WAV_HEADER_BYTES
+from src.common.exceptions import GatewayException
+from src.setting import settings
+
+# 计算音量的帧长（秒）
+FRAME_SECONDS = 0.02
+# 每次读取并计算音量的音频时长（秒）
+READ_SECONDS = 10
+# 拼接重叠分段的识别结果时，最多比较的重复字符数
+MAX_STITCH_CHARS = 32
+PCM_CONTENT_TYPES = ('audio/pcm', 'audio/l16')
+
+
+@dataclass
+class AudioSegment:
+    # 起止位置（采样帧）
+    start: int
+    end: int
+    # 与前一段重叠的采样帧数，按静音切分时为 0
+    overlap: int = 0
+
+    @property
+    def frames(self) -> int:
+        return self.end - self.start
+
+    @property
+    def billed_ratio(self) -> float:
+        """
+        重叠部分只按前一段计费
+        """
+        return (self.frames - self.overlap) / self.frames if self.frames else 0
+
+
+def audio_layout(head: bytes, filename: str, content_type: str, sample_rate: int) -> Optional[tuple[WavFormat, int]]:
+    """
+    返回 (音频格式, 音频数据起始位置)，只支持 16bit PCM 编码的 WAV 和裸 PCM（单声道），其余格式返回 None
+    """
+    if content_type in PCM_CONTENT_TYPES or (filename or '').lower().endswith('.pcm'):
+        return WavFormat(1, 1, sample_rate, 16), 0
+    try:
+        layout = parse_wav_header(head[:MAX_WAV_HEADER_BYTES])
+    except GatewayException:
+        return None
+    if layout is None or layout[0].audio_format != 1 or layout[0].bits_per_sample != 16:
+        return None
+    return layout
+
+
+async def frame_energy(read: Callable[[int, int], Awaitable[bytes]], fmt: WavFormat, offset: int,
+                       size: int) -> np.ndarray:
+    """
+    分块读取音频数据，计算每 20ms 的音量（dBFS），多声道取平均
+    """
+    frame = max(int(fmt.sample_rate * FRAME_SECONDS), 1)
+    block = frame * int(READ_SECONDS / FRAME_SECONDS) * fmt.block_align
+    size -= size % fmt.block_align
+    energies = []
+    for pos in range(0, size, block):
+        data = await read(offset + pos, min(block, size - pos))
+        samples = np.frombuffer(data, dtype='<i2').reshape(-1, fmt.channels).mean(axis=1)
+        count = len(samples) // frame * frame
+        if count < len(samples):
+            samples = np.concatenate([samples, np.zeros(count + frame - len(samples))])
+        rms = np.sqrt(np.mean(np.square(samples.reshape(-1, frame)), axis=1))
+        energies.append(20 * np.log10(np.maximum(rms, 1) / 32768))
+    return np.concatenate(energies) if energies else np.zeros(0)
+
+
+def plan_segments(energy: np.ndarray, sample_rate: int, total_frames: int) -> list[AudioSegment]:
+    """
+    按分段时长切分，在每段末尾向前查找最安静的位置作为切分点；找不到静音时按固定时长切分，相邻分段重叠
+    """
+    frame = max(int(sample_rate * FRAME_SECONDS), 1)
+    window = max(int(settings.ASR_SEGMENT_SECONDS / FRAME_SECONDS), 1)
+    search = min(int(settings.ASR_SEGMENT_SEARCH_SECONDS / FRAME_SECONDS), window - 1)
+    overlap = min(int(settings.ASR_SEGMENT_OVERLAP_SECONDS / FRAME_SECONDS), window // 2)
+
+    segments, start, start_overlap = [], 0, 0
+    # 剩余部分不足 1.5 个分段时不再切分，避免末尾出现过短的分段
+    while len(energy) - start > window * 1.5:
+        low, high = start + window - search, start + window
+        cut = low + int(np.argmin(energy[low:high + 1]))
+        if energy[cut] <= settings.ASR_SILENCE_DBFS:
+            segments.append(AudioSegment(start * frame, cut * frame, start_overlap * frame))
+            start, start_overlap = cut, 0
+        else:
+            segments.append(AudioSegment(start * frame, high * frame, start_overlap * frame))
+            start, start_overlap = high - overlap, overlap
+    segments.append(AudioSegment(start * frame, total_frames, start_overlap * frame))
+    return segments
+
+
+def stitch_texts(texts: list[str], segments: list[AudioSegment]) -> str:
+    """
+    按顺序拼接各分段的识别结果，重叠分段去掉开头与前一段结尾重复的文字
+    """
+    ret = ''
+    for text, segment in zip(texts, segments):
+        text = (text or '').strip()
+        if segment.overlap and ret:
+            for size in range(min(len(ret), len(text), MAX_STITCH_CHARS), 1, -1):
+                if ret.endswith(text[:size]):
+                    text = text[size:].lstrip()
+                    break
+        if not text:
+            continue
+        # 英文等按空格分词的语言，分段之间补空格
+        if ret and ret[-1].isascii() and text[0].isascii() and ret[-1].isalnum():
+            ret += ' '
+        ret += text
+    return ret
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import re
+import typing
+
+# 句末标点，以及句内可以停顿的标点；英文句号需后跟空白，不切开小数
+SENTENCE_END = re.compile(r'[。！？!?；;…\n]|\.\s')
+CLAUSE_END = re.compile(r'(?<=[，,、：:])')
+# 英文句号前是常见缩写（Dr. Smith、e.g. this）或单个字母（人名缩写 J. K.）时不是句末
+ABBREVIATION = re.compile(r'\b(?:mr|mrs|ms|dr|prof|sr|jr|st|mt|no|fig|vs|etc|inc|ltd|co|e\.g|i\.e|[a-z])\.[ \t]$',
+                          re.IGNORECASE)
+# 缩写检查向前查看的字符数
+ABBREVIATION_CHARS = 8
+WHITESPACE = re.compile(r'\s')
+
+
+def iter_sentences(text: str) -> typing.Iterator[str]:
+    """
+    按句末标点切分，标点及其后的一个空白字符留在前一句中
+    """
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        if ABBREVIATION.search(text, max(match.start() - ABBREVIATION_CHARS, 0), end):
+            continue
+        yield text[start:end]
+        start = end
+    yield text[start:]
+
+
+def split_words(clause: str, max_chars: int) -> list[str]:
+    """
+    按长度切分，切分点前移到 max_chars 之内最后一个空白字符之后，不切开英文单词；没有空白（如中文）时按长度切分
+    """
+    pieces = []
+    while len(clause) > max_chars:
+        cut = max((match.end() for match in WHITESPACE.finditer(clause, 1, max_chars)), default=max_chars)
+        pieces.append(clause[:cut])
+        clause = clause[cut:]
+    pieces.append(clause)
+    return pieces
+
+
+def split_clauses(sentence: str, max_chars: int) -> list[str]:
+    """
+    超长的句子按逗号等切分，仍然超长时按空白或长度切分
+    """
+    pieces = []
+    for clause in CLAUSE_END.split(sentence):
+        pieces.extend(split_words(clause, max_chars) if len(clause) > max_chars else [clause])
+    return pieces
+
+
+def split_sentences(text: str, max_chars: int) -> list[str]:
+    """
+    按句子切分，再把相邻的句子合并为不超过 max_chars 个字符的分段
+    分段拼接后与原文完全一致（空白也保留在分段中），各分段按字符数计费的总和与整段相同
+    """
+    segments, current = [], ''
+    for sentence in iter_sentences(text):
+        for piece in (split_clauses(sentence, max_chars) if len(sentence) > max_chars else [sentence]):
+            if current.strip() and piece.strip() and len(current) + len(piece) > max_chars:
+                segments.append(current)
+                current = ''
+            current += piece
+    if current.strip() or not segments:
+        segments.append(current)
+    else:
+        segments[-1] += current
+    return segments
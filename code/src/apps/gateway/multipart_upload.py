@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import tempfile
+from http import HTTPStatus
+from typing import AsyncIterator, Iterable, Optional
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from src.common.exceptions import GatewayException
+from src.setting import settings
+
+# 从缓存文件读取数据转发时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+# 文件数据在内存中缓存的上限，超过后写入临时文件
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def quote(value: str) -> str:
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def field_part(boundary: str, name: str, value) -> bytes:
+    value = '' if value is None else value
+    return f'--{boundary}\r\nContent-Disposition: form-data; name="{quote(name)}"\r\n\r\n{value}\r\n'.encode()
+
+
+def form_openapi(properties: dict, required: list[str]) -> dict:
+    """
+    手动解析请求体的接口在 openapi 文档中声明表单参数
+    """
+    schema = {'type': 'object', 'properties': properties, 'required': required}
+    return {'requestBody': {'required': True, 'content': {'multipart/form-data': {'schema': schema}}}}
+
+
+class MultipartUpload:
+    """
+    流式读取客户端的 multipart/form-data 上传请求：文本字段读入内存，文件数据边读边转发给上游，内存占用与文件大小无关
+    必填字段都在文件之前时，读到文件开头即可调用上游；文件在必填字段之前时，文件数据先缓存（超过 1MB 写入临时文件）
+    """
+
+    def __init__(self, request: Request, file_field: str):
+        content_type, params = parse_options_header(request.headers.get('content-type', ''))
+        if content_type != b'multipart/form-data' or not params.get(b'boundary'):
+            raise GatewayException('请使用 multipart/form-data 格式上传文件', HTTPStatus.BAD_REQUEST)
+        self.max_bytes = settings.AUDIO_UPLOAD_MAX_BYTES
+        content_length = request.headers.get('content-length', '')
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise self.too_large()
+
+        self.file_field = file_field
+        self.fields: dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_content_type = 'application/octet-stream'
+        self.file_done = False
+        self.finished = False
+        # 已经开始从客户端连接直接转发文件数据，上游调用失败后不能再换渠道重试
+        self.streaming = False
+
+        self._receive = request.stream()
+        self._received = 0
+        self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self._spooled = 0
+        # 并发读取缓存文件时 seek + read 需要串行
+        self._spool_lock = asyncio.Lock()
+        # 已解析、还未转发（或缓存）的文件数据
+        self._pending: list[bytes] = []
+        # 当前 part 的状态
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._part_name: Optional[str] = None
+        self._part_file = False
+        self._part_skip = False
+        self._part_value = bytearray()
+        self._parser = MultipartParser(params[b'boundary'], callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def too_large(self) -> GatewayException:
+        return GatewayException(f'上传文件大小超过限制[{self.max_bytes // 1024 // 1024}MB]',
+                                HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part_name, self._part_file, self._part_skip = None, False, False
+        self._part_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b'', b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._part_name = options.get(b'name', b'').decode('utf-8', 'replace')
+        # 只转发一个文件，其余文件字段忽略
+        if b'filename' in options:
+            self._part_file = self._part_name == self.file_field and self.filename is None
+            self._part_skip = not self._part_file
+            if self._part_file:
+                self.filename = options[b'filename'].decode('utf-8', 'replace')
+                self.file_content_type = (self._headers.get(b'content-type') or b'application/octet-stream').decode()
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part_file:
+            self._pending.append(data[start:end])
+        elif not self._part_skip:
+            self._part_value += data[start:end]
+
+    def _on_part_end(self):
+        if self._part_file:
+            self.file_done = True
+        elif self._part_name and not self._part_skip:
+            self.fields[self._part_name] = self._part_value.decode('utf-8', 'replace')
+        self._part_name, self._part_file, self._part_skip = None, False, False
+
+    async def _read(self):
+        """
+        从客户端连接读取一块数据交给解析器，超过请求体大小上限时中断
+        """
+        try:
+            chunk = await self._receive.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            self.finished = True
+            return
+        self._received += len(chunk)
+        if self._received > self.max_bytes:
+            raise self.too_large()
+        self._parser.write(chunk)
+
+    def _take_pending(self) -> list[bytes]:
+        pending, self._pending = self._pending, []
+        return pending
+
+    async def _spool_io(self, func, *args):
+        # 缓存超过内存上限后已写入临时文件，文件读写放到线程池中执行
+        if self._spooled > SPOOL_MAX_SIZE:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def _spool_pending(self):
+        for chunk in self._take_pending():
+            self._spooled += len(chunk)
+            await self._spool_io(self._spool.write, chunk)
+
+    async def read_fields(self, required: Iterable[str] = ('model',), whole=False) -> dict[str, str]:
+        """
+        读取到文件开头（且必填字段都已读到）为止，返回已读到的文本字段
+        whole: 读完整个请求体，文件数据全部缓存，适用于较小的文件
+        """
+        required = tuple(required)
+        while not self.finished:
+            if not whole and self.filename is not None and all(name in self.fields for name in required):
+                break
+            await self._read()
+            await self._spool_pending()
+        missing = [name for name in required if not self.fields.get(name)]
+        if missing:
+            raise GatewayException(f'缺少参数[{", ".join(missing)}]', HTTPStatus.BAD_REQUEST)
+        return self.fields
+
+    @property
+    def file_size(self) -> int:
+        """
+        已缓存的文件大小，read_fields(whole=True) 之后为完整的文件大小
+        """
+        return self._spooled
+
+    async def read_file(self, offset: int, size: int) -> bytes:
+        """
+        读取已缓存的文件数据
+        """
+        async with self._spool_lock:
+            await self._spool_io(self._spool.seek, offset)
+            return await self._spool_io(self._spool.read, size)
+
+    def body(self, fields: dict, file_field: str, late_fields: dict = None) -> 'UpstreamBody':
+        """
+        fields: 放在文件之前发往上游的字段
+        late_fields: 放在文件之后发往上游的字段及默认值，客户端在文件之后传了该字段时原样转发
+        """
+        return UpstreamBody(self, fields, file_field, late_fields or {})
+
+    def close(self):
+        self._spool.close()
+
+    async def stream(self, boundary: str, fields: dict, file_field: str,
+                     late_fields: dict) -> AsyncIterator[bytes]:
+        """
+        生成发往上游的 multipart 请求体：字段、已缓存的文件数据、客户端连接上剩余的文件数据、文件之后的字段
+        """
+        for name, value in fields.items():
+            yield field_part(boundary, name, value)
+        if self.filename is not None:
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{quote(file_field)}"; '
+                   f'filename="{quote(self.filename)}"\r\nContent-Type: {self.file_content_type}\r\n\r\n').encode()
+            # 同一份缓存可能同时发给多个渠道，按位置读取
+            pos = 0
+            while chunk := await self.read_file(pos, CHUNK_SIZE):
+                pos += len(chunk)
+                yield chunk
+            while not self.file_done and not self.finished:
+                self.streaming = True
+                await self._read()
+                for chunk in self._take_pending():
+                    yield chunk
+            yield b'\r\n'
+
+        # 读完请求体剩余部分，客户端放在文件之后的字段原样转发
+        while not self.finished:
+            await self._read()
+            self._pending.clear()
+        for name, default in late_fields.items():
+            yield field_part(boundary, name, self.fields.get(name, default))
+        yield f'--{boundary}--\r\n'.encode()
+
+
+class UpstreamBody:
+    """
+    发往上游的 multipart 请求体，每次迭代重新生成；文件数据还没开始从客户端连接转发时可以换渠道重发
+    """
+
+    def __init__(self, upload: MultipartUpload, fields: dict, file_field: str, late_fields: dict):
+        self.upload = upload
+        self.fields = fields
+        self.file_field = file_field
+        self.late_fields = late_fields
+        self.boundary = os.urandom(16).hex()
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def replayable(self) -> bool:
+        return not self.upload.streaming
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self.upload.stream(self.boundary, self.fields, self.file_field, self.late_fields)
@@ -1,5 +1,4 @@
 """Pydantic models for OpenAI API protocol"""
-import json
 import time
 from dataclasses import dataclass
 from enum import Enum
@@ -8,6 +7,8 @@ from typing import Dict, List, Optional, Union
 from pydantic import BaseModel, Field
 from typing_extensions import Literal
 
+from src.apps.gateway.serializer import sse_frame
+
 
 class ModelCard(BaseModel):
     """Model cards."""
@@ -416,11 +417,11 @@ def empty_chat_response(content: str, model=None) -> dict:
 
 @dataclass
 class ChatContentLine:
-    content: Union[str, dict]
+    content: Union[str, dict, bytes]
     type_: Optional[ChatType] = ChatType.Text
     data: dict = None
 
     def __post_init__(self):
-        if isinstance(self.content, dict):
-            self.content = json.dumps(self.content, ensure_ascii=False)
-        self.content = f'data: {self.content}\n\n'
+        # raw upstream bytes are forwarded as-is, the others are encoded into an SSE frame
+        if not isinstance(self.content, bytes):
+            self.content = sse_frame(self.content)
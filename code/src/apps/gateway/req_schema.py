@@ -23,6 +23,8 @@ class TTSReq(InfBaseReq):
     input: str
     voice: str
     speed: float = 1.0
+    # 音频格式：wav、pcm（16bit 裸数据），均为流式返回，其余格式（如 mp3）按 wav 返回
+    response_format: str = "wav"
 
 
 class EmbeddingsReq(InfBaseReq):
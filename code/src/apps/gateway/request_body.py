@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from http import HTTPStatus
+from typing import Type
+
+import orjson
+from fastapi import Request
+from pydantic import BaseModel, ValidationError
+
+from src.apps.gateway.protocol import ChatCompletionRequest, CompletionRequest
+from src.common.exceptions import GatewayException
+from src.setting import settings
+
+# 快速校验时只检查网关会用到的字段：字段 -> (类型, 是否必填)，其余字段原样转发给推理服务
+GATEWAY_FIELDS: dict[Type[BaseModel], dict[str, tuple]] = {
+    ChatCompletionRequest: {
+        'model': (str, True),
+        'messages': (list, True),
+        'stream': (bool, False),
+        'stream_options': (dict, False),
+        'max_tokens': (int, False),
+        'tools': (list, False),
+    },
+    CompletionRequest: {
+        'model': (str, True),
+        'prompt': ((str, list), True),
+        'stream': (bool, False),
+        'stream_options': (dict, False),
+        'max_tokens': (int, False),
+    },
+}
+
+
+def inline_refs(node, definitions: dict, resolving: tuple = ()):
+    """
+    展开 json schema 中引用的子模型，自引用的模型只保留 object 类型
+    """
+    if isinstance(node, list):
+        return [inline_refs(item, definitions, resolving) for item in node]
+    if not isinstance(node, dict):
+        return node
+    ref = node.get('$ref')
+    if ref is not None:
+        if ref in resolving:
+            return {'type': 'object', 'title': ref}
+        return inline_refs(definitions[ref], definitions, resolving + (ref,))
+    return {key: inline_refs(value, definitions, resolving) for key, value in node.items()}
+
+
+def body_openapi(schema: Type[BaseModel]) -> dict:
+    """
+    手动解析请求体的接口在 openapi 文档中声明请求体参数
+    """
+    model_schema = schema.schema(ref_template='{model}')
+    definitions = model_schema.pop('definitions', {})
+    content = {'application/json': {'schema': inline_refs(model_schema, definitions)}}
+    return {'requestBody': {'required': True, 'content': content}}
+
+
+def validate_fields(body: dict, schema: Type[BaseModel]) -> list[dict]:
+    errors = []
+    for field, (type_, required) in GATEWAY_FIELDS[schema].items():
+        value = body.get(field)
+        if value is None:
+            if required:
+                errors.append({'loc': ('body', field), 'msg': 'field required', 'type': 'value_error.missing'})
+        # bool 是 int 的子类，需要单独排除
+        elif not isinstance(value, type_) or (type_ is int and isinstance(value, bool)):
+            errors.append({'loc': ('body', field), 'msg': 'invalid type', 'type': 'type_error'})
+    return errors
+
+
+async def parse_body(request: Request, schema: Type[BaseModel]) -> dict:
+    """
+    解析请求体，只解析一次
+    默认用 orjson 解析后只校验网关用到的字段，开启 GATEWAY_STRICT_VALIDATION 时使用 pydantic 完整校验
+    """
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as e:
+        raise GatewayException(f'参数校验失败: 请求体不是合法的 json[{e}]', HTTPStatus.UNPROCESSABLE_ENTITY)
+    if not isinstance(body, dict):
+        raise GatewayException('参数校验失败: 请求体必须是 json 对象', HTTPStatus.UNPROCESSABLE_ENTITY)
+
+    if settings.GATEWAY_STRICT_VALIDATION:
+        try:
+            schema.parse_obj(body)
+        except ValidationError as e:
+            raise GatewayException(f'参数校验失败: {e.errors()}', HTTPStatus.UNPROCESSABLE_ENTITY)
+    else:
+        errors = validate_fields(body, schema)
+        if errors:
+            raise GatewayException(f'参数校验失败: {errors}', HTTPStatus.UNPROCESSABLE_ENTITY)
+    return body
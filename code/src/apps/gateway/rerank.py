@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import math
+
+from src.setting import settings
+
+
+def shard_count(documents: int, channels: int) -> int:
+    """
+    分片数：按单片文档数上限计算，不超过最大分片数；没有可用渠道时不分片
+    """
+    if not channels or documents <= settings.RERANK_SHARD_SIZE:
+        return 1
+    return min(math.ceil(documents / settings.RERANK_SHARD_SIZE), settings.RERANK_MAX_SHARDS)
+
+
+def shard_documents(documents: list[str], shards: int) -> list[tuple[int, list[str]]]:
+    """
+    按顺序均分文档，返回 (起始下标, 文档列表)
+    """
+    size = math.ceil(len(documents) / shards)
+    return [(offset, documents[offset:offset + size]) for offset in range(0, len(documents), size)]
+
+
+def sum_usage(usages: list[dict]) -> dict:
+    ret = {}
+    for usage in usages:
+        for key, value in (usage or {}).items():
+            if isinstance(value, (int, float)):
+                ret[key] = ret.get(key, 0) + value
+    return ret
+
+
+def merge_results(shards: list[tuple[int, dict]], top_n: int = None) -> dict:
+    """
+    合并各分片的排序结果：还原文档在原始列表中的下标，按分数全局排序后取 top_n，用量求和
+    同一模型的各渠道分数可以直接比较
+    """
+    results = []
+    for offset, ret_data in shards:
+        for item in ret_data.get('results') or []:
+            results.append({**item, 'index': item['index'] + offset})
+    results.sort(key=lambda item: item.get('relevance_score', 0), reverse=True)
+    if top_n:
+        results = results[:top_n]
+    return {**shards[0][1], 'results': results, 'usage': sum_usage([ret_data.get('usage') for _, ret_data in shards])}
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+import orjson
+from cachetools import TTLCache
+from fastapi import Request
+
+from src.apps.apikey.rsp_schema import ApiKey
+from src.apps.gateway.serializer import loads
+from src.apps.metrics.curd import metrics_curd
+from src.common.loggers import logger
+from src.setting import settings
+from src.system.integrations.cache.redis_client import async_redis_client
+
+# 请求头开启/关闭响应缓存，如：x-imaas-cache: on
+CACHE_HEADER = 'x-imaas-cache'
+CACHE_HEADER_ON = ('1', 'true', 'on')
+CACHE_HEADER_OFF = ('0', 'false', 'off', 'no-cache')
+REDIS_KEY_PREFIX = 'response_cache:'
+
+
+@dataclass
+class CachedResponse:
+    # 首次生成响应的渠道，命中缓存时按该渠道上报调用数据
+    channel_id: str
+    usage: dict
+    # 非流式为响应体，流式为完整的 SSE 数据
+    content: bytes
+    stream: bool = False
+
+    def frames(self):
+        """
+        按 SSE 事件拆分，流式回放
+        """
+        start = 0
+        while (end := self.content.find(b'\n\n', start)) != -1:
+            yield self.content[start:end + 2]
+            start = end + 2
+
+    def encode(self) -> str:
+        return orjson.dumps({'channel_id': self.channel_id, 'usage': self.usage, 'content': self.content.decode('utf-8'),
+                             'stream': self.stream}).decode('utf-8')
+
+    @classmethod
+    def decode(cls, value: str) -> 'CachedResponse':
+        data = loads(value)
+        return cls(data['channel_id'], data['usage'], data['content'].encode('utf-8'), data['stream'])
+
+
+@dataclass
+class StreamRecorder:
+    """
+    记录流式响应返回给客户端的数据，完整结束后写入缓存
+    """
+    frames: list[bytes] = field(default_factory=list)
+    usage: Optional[dict] = None
+    failed: bool = False
+
+
+class ResponseCache:
+    """
+    对话响应缓存（相同用户、相同请求体），两级：进程内 LRU + redis，均有过期时间和大小限制
+    """
+
+    def __init__(self):
+        self._memory = TTLCache(maxsize=settings.RESPONSE_CACHE_MEMORY_BYTES, ttl=settings.RESPONSE_CACHE_TTL,
+                                getsizeof=lambda item: len(item.content))
+        self._model_exprs = [expr for expr in settings.RESPONSE_CACHE_MODELS.split(',') if expr]
+
+    def enabled(self, request: Request, body: dict) -> bool:
+        """
+        请求头优先；未指定时，配置的模型在结果确定（temperature=0 或指定 seed）时开启
+        """
+        header = request.headers.get(CACHE_HEADER, '').lower()
+        if header in CACHE_HEADER_ON:
+            return True
+        if header in CACHE_HEADER_OFF:
+            return False
+        if body.get('temperature') != 0 and body.get('seed') is None:
+            return False
+        return any(re.match(rf'^{expr}$', body['model']) for expr in self._model_exprs)
+
+    @staticmethod
+    def key(body: dict, api_key_data: ApiKey) -> str:
+        """
+        缓存 key：用户 + 规范化（key 排序）后的请求体，不同用户之间不共享
+        """
+        canonical = orjson.dumps(body, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        return hashlib.sha256(api_key_data.creator.encode('utf-8') + b'\n' + canonical).hexdigest()
+
+    async def get(self, key: str, model: str) -> Optional[CachedResponse]:
+        item, tier = self._memory.get(key), 'memory'
+        if item is None and settings.RESPONSE_CACHE_REDIS:
+            tier = 'redis'
+            try:
+                value = await async_redis_client.get(f'{REDIS_KEY_PREFIX}{key}')
+                item = CachedResponse.decode(value) if value else None
+            except Exception as e:
+                logger.warning(f'读取响应缓存[{key}]失败: {e}')
+            if item is not None:
+                self._set_memory(key, item)
+        metrics_curd.submit_response_cache(model, tier if item is not None else 'miss')
+        return item
+
+    def _set_memory(self, key: str, item: CachedResponse):
+        try:
+            self._memory[key] = item
+        except ValueError:
+            # 超过内存缓存总大小
+            pass
+
+    async def set(self, key: str, item: CachedResponse):
+        if len(item.content) > settings.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+            return
+        self._set_memory(key, item)
+        if settings.RESPONSE_CACHE_REDIS:
+            try:
+                await async_redis_client.set(f'{REDIS_KEY_PREFIX}{key}', item.encode(), ex=settings.RESPONSE_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f'写入响应缓存[{key}]失败: {e}')
+
+
+response_cache = ResponseCache()
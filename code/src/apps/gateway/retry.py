@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import time
+from http import HTTPStatus
+from typing import Sequence
+
+from httpx import TransportError
+
+from src.apps.gateway.routing_table import ChannelRoute
+from src.common.exceptions import GatewayException
+from src.setting import settings
+
+# 上游返回以下状态码时换渠道重试，其余 4xx 属于请求本身的问题，重试无意义
+RETRY_STATUS = (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.INTERNAL_SERVER_ERROR, HTTPStatus.BAD_GATEWAY,
+                HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT)
+
+
+class RetryDispatch(Exception):
+    """
+    当前渠道调用失败，需要切换渠道重新发起
+    """
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, GatewayException):
+        return e.code in RETRY_STATUS
+    # 连接失败、超时、连接被断开等网络异常
+    return isinstance(e, TransportError)
+
+
+class UpstreamRetry:
+    """
+    单次请求的重试状态：尝试次数预算、总截止时间、已失败的渠道
+    """
+
+    def __init__(self, timeout: float):
+        self.start_time = time.time()
+        self.timeout = timeout
+        # 截止时间按本次调用的超时时间计算，重试最多在此基础上延长 UPSTREAM_RETRY_DEADLINE 秒
+        self.deadline = self.start_time + timeout + settings.UPSTREAM_RETRY_DEADLINE
+        self.attempt = 0
+        self.excluded: set[str] = set()
+        # 失败尝试累计耗时，用于统计重试带来的额外延迟
+        self.retry_cost = 0.0
+
+    def next_attempt(self) -> float:
+        """
+        开始新的一次尝试，返回本次尝试的超时时间，不超过剩余的截止时间
+        """
+        self.attempt += 1
+        return max(min(self.timeout, self.deadline - time.time()), 1)
+
+    def can_retry(self, e: Exception, channel: ChannelRoute, channels: Sequence[ChannelRoute], cost_time: float) -> bool:
+        """
+        记录失败的渠道，并判断是否还能换渠道重试
+        """
+        self.excluded.add(channel.channel_id)
+        self.retry_cost += cost_time
+        if self.attempt >= settings.UPSTREAM_MAX_ATTEMPTS or not is_retryable(e):
+            return False
+        if time.time() >= self.deadline:
+            return False
+        return any(item.channel_id not in self.excluded for item in channels)
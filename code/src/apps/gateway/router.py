@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import bisect
+import hashlib
+import math
+import random
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+from src.apps.gateway.routing_table import ChannelRoute
+from src.apps.gateway.token_counter import content_text
+from src.common.loggers import logger
+from src.setting import settings
+
+
+@dataclass
+class ChannelLoad:
+    # 进行中的请求数
+    inflight: int = 0
+    # 首个响应数据耗时（非流式为整体耗时）的指数加权移动平均，秒
+    ewma_ttft: Optional[float] = None
+
+
+class ChannelLoadTracker:
+    """
+    进程内的渠道负载统计，按 channel_id 记录进行中的请求数和 TTFT
+    """
+
+    def __init__(self):
+        self._loads: dict[str, ChannelLoad] = {}
+
+    def get(self, channel_id: str) -> ChannelLoad:
+        load = self._loads.get(channel_id)
+        if load is None:
+            load = self._loads[channel_id] = ChannelLoad()
+        return load
+
+    def start(self, channel_id: str):
+        self.get(channel_id).inflight += 1
+
+    def finish(self, channel_id: str):
+        load = self.get(channel_id)
+        load.inflight = max(load.inflight - 1, 0)
+
+    def observe_ttft(self, channel_id: str, ttft: float):
+        load = self.get(channel_id)
+        alpha = settings.ROUTING_EWMA_ALPHA
+        load.ewma_ttft = ttft if load.ewma_ttft is None else alpha * ttft + (1 - alpha) * load.ewma_ttft
+
+
+channel_loads = ChannelLoadTracker()
+
+
+def stable_hash(value: str) -> int:
+    """
+    跨进程稳定的哈希（内置 hash 受 PYTHONHASHSEED 影响，每个进程结果不同）
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    一致性哈希环，每个渠道的虚拟节点数按权重放大，渠道增减时只有约 1/N 的 key 改变映射
+    """
+
+    def __init__(self, channel_weights: tuple[tuple[str, int], ...], vnodes: int):
+        nodes = sorted((stable_hash(f'{channel_id}#{i}'), channel_id)
+                       for channel_id, weight in channel_weights for i in range(vnodes * weight))
+        self.points = [point for point, _ in nodes]
+        self.owners = [channel_id for _, channel_id in nodes]
+
+    def walk(self, key_hash: int):
+        """
+        从 key 所在位置顺时针遍历，依次返回不重复的渠道
+        """
+        start = bisect.bisect(self.points, key_hash)
+        seen = set()
+        for i in range(len(self.owners)):
+            channel_id = self.owners[(start + i) % len(self.owners)]
+            if channel_id not in seen:
+                seen.add(channel_id)
+                yield channel_id
+
+
+@lru_cache(maxsize=256)
+def hash_ring(channel_weights: tuple[tuple[str, int], ...]) -> HashRing:
+    return HashRing(channel_weights, settings.ROUTING_HASH_VNODES)
+
+
+def consistent_hash_select(channels: Sequence[ChannelRoute], key: str) -> ChannelRoute:
+    """
+    有界负载的一致性哈希：按 key 在环上的位置选择渠道，渠道进行中的请求数超过上限时顺延到下一个渠道
+    上限为 ROUTING_HASH_LOAD_FACTOR * 按权重分摊的进行中请求数（向上取整）
+    """
+    by_id = {item.channel_id: item for item in channels}
+    ring = hash_ring(tuple(sorted((item.channel_id, item.weight) for item in by_id.values())))
+    total = sum(channel_loads.get(channel_id).inflight for channel_id in by_id)
+    total_weight = sum(item.weight for item in by_id.values())
+    first = None
+    for channel_id in ring.walk(stable_hash(key)):
+        limit = math.ceil(settings.ROUTING_HASH_LOAD_FACTOR * (total + 1) * by_id[channel_id].weight / total_weight)
+        if channel_loads.get(channel_id).inflight < limit:
+            return by_id[channel_id]
+        first = first or by_id[channel_id]
+    return first
+
+
+def prompt_prefix(body: dict) -> str:
+    """
+    提示词前缀：按顺序拼接各条消息（system prompt + 前几轮对话），取前 ROUTING_PREFIX_CHARS 个字符
+    同一会话的多轮请求、相同 system prompt 的请求前缀相同
+    """
+    limit = settings.ROUTING_PREFIX_CHARS
+    if 'messages' not in body:
+        prompt = body.get('prompt')
+        if isinstance(prompt, list) and prompt and isinstance(prompt[0], str):
+            prompt = prompt[0]
+        return content_text(prompt)[:limit]
+
+    parts, length = [], 0
+    for message in body.get('messages') or []:
+        part = f"{message.get('role')}:{content_text(message.get('content'))}\n"
+        parts.append(part)
+        length += len(part)
+        if length >= limit:
+            break
+    return ''.join(parts)[:limit]
+
+
+# 渠道选择策略注册表，策略签名：(channels, api_key, affinity_key) -> channel
+routing_strategies: dict[str, Callable[[Sequence[ChannelRoute], Optional[str], Optional[str]], ChannelRoute]] = {}
+
+
+def routing_strategy(name: str):
+    def decorator(func):
+        routing_strategies[name] = func
+        return func
+    return decorator
+
+
+@routing_strategy('hash')
+def hash_strategy(channels: Sequence[ChannelRoute], api_key: str = None, affinity_key: str = None) -> ChannelRoute:
+    """
+    按 api key 固定渠道（有界负载的一致性哈希，各 worker、各实例结果一致），没有 api key 时随机选择
+    """
+    if api_key:
+        return consistent_hash_select(channels, api_key)
+    return random_strategy(channels)
+
+
+@routing_strategy('random')
+def random_strategy(channels: Sequence[ChannelRoute], api_key: str = None, affinity_key: str = None) -> ChannelRoute:
+    """
+    按渠道权重随机选择
+    """
+    return random.choices(channels, weights=[item.weight for item in channels])[0]
+
+
+@routing_strategy('least_outstanding')
+def least_outstanding_strategy(channels: Sequence[ChannelRoute], api_key: str = None,
+                               affinity_key: str = None) -> ChannelRoute:
+    """
+    选择进行中请求数 / 权重最小的渠道，相同时随机选择
+    """
+    loads = [channel_loads.get(item.channel_id).inflight / item.weight for item in channels]
+    min_load = min(loads)
+    return random.choice([item for item, load in zip(channels, loads) if load == min_load])
+
+
+def _p2c_score(channel: ChannelRoute, default_ttft: float) -> float:
+    load = channel_loads.get(channel.channel_id)
+    ttft = load.ewma_ttft if load.ewma_ttft is not None else default_ttft
+    return ttft * (load.inflight + 1) / channel.weight
+
+
+@routing_strategy('p2c_ewma')
+def p2c_ewma_strategy(channels: Sequence[ChannelRoute], api_key: str = None, affinity_key: str = None) -> ChannelRoute:
+    """
+    随机取两个渠道，选择 TTFT 均值 * (进行中请求数 + 1) / 权重 较小的一个
+    没有统计数据的渠道按已知的最小 TTFT 计算，保证新渠道能分到流量
+    """
+    if len(channels) == 1:
+        return channels[0]
+    first, second = random.sample(channels, 2)
+    known = [load.ewma_ttft for load in (channel_loads.get(item.channel_id) for item in (first, second))
+             if load.ewma_ttft is not None]
+    default_ttft = min(known) if known else 1.0
+    return first if _p2c_score(first, default_ttft) <= _p2c_score(second, default_ttft) else second
+
+
+@routing_strategy('prefix_affinity')
+def prefix_affinity_strategy(channels: Sequence[ChannelRoute], api_key: str = None,
+                             affinity_key: str = None) -> ChannelRoute:
+    """
+    按提示词前缀做有界负载的一致性哈希，相同前缀的请求落到同一渠道，复用上游的 prefix cache
+    没有前缀（非对话接口）时按 api key 选择
+    """
+    if affinity_key:
+        return consistent_hash_select(channels, affinity_key)
+    return hash_strategy(channels, api_key)
+
+
+def model_strategy(model: str) -> str:
+    """
+    模型对应的渠道选择策略，ROUTING_MODEL_STRATEGY 中的 key 支持正则
+    """
+    conf = settings.ROUTING_MODEL_STRATEGY
+    if model in conf:
+        return conf[model]
+    for expr, strategy in conf.items():
+        if re.match(rf'^{expr}$', model):
+            return strategy
+    return settings.ROUTING_STRATEGY
+
+
+def prompt_affinity_key(model: str, body: dict) -> Optional[str]:
+    """
+    模型使用 prefix_affinity 策略时返回提示词前缀，其他策略不需要
+    """
+    if model_strategy(model) != 'prefix_affinity':
+        return None
+    return prompt_prefix(body) or None
+
+
+def select_channel(model: str, channels: Sequence[ChannelRoute], api_key: str = None,
+                   affinity_key: str = None) -> ChannelRoute:
+    if len(channels) == 1:
+        return channels[0]
+    name = model_strategy(model)
+    strategy = routing_strategies.get(name)
+    if strategy is None:
+        logger.warning(f'模型[{model}]配置了不存在的渠道选择策略[{name}]，使用默认策略')
+        strategy = hash_strategy
+    return strategy(channels, api_key, affinity_key)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from types import MappingProxyType
+from typing import Optional
+
+from src.apps.channel.curd import channel_curd
+from src.common.const.comm_const import API_KEY_PREFIX
+from src.common.loggers import logger
+
+# 网关代理的接口路径（已去掉 /v1），编译路由表时预先生成每个渠道的代理地址
+ENDPOINT_PATHS = ('/chat/completions', '/completions', '/embeddings', '/rerank', '/audio/speech',
+                  '/audio/transcriptions')
+
+
+def resolve_proxy_url(proxy_host: str, req_path: str) -> str:
+    """
+    代理 url，逻辑：1. 以 '/' 结尾忽略 '/v1' 2. 以 '#' 结尾强制使用
+    """
+    if proxy_host.endswith('#'):
+        return proxy_host[:-1]
+    elif proxy_host.endswith('/'):
+        return proxy_host[:-1] + req_path
+    return proxy_host + '/v1' + req_path
+
+
+class ChannelRoute:
+    """
+    模型在某个渠道上的路由信息，编译后不再修改
+    """
+    __slots__ = ('channel_id', 'inference_service', 'health_status', 'max_concurrency', 'weight', 'proxy_model',
+                 'headers', 'urls')
+
+    def __init__(self, row: dict, model: str):
+        self.channel_id: str = row['channel_id']
+        self.inference_service: str = row['inference_service']
+        self.health_status = row['health_status']
+        # 集群内最大并发请求数（0 不限制）、容量权重
+        self.max_concurrency: int = row.get('max_concurrency') or 0
+        self.weight: int = max(row.get('weight') or 1, 1)
+        redirection = row['model_redirection'] or {}
+        self.proxy_model: str = redirection[model] if model in redirection else model
+        self.headers = MappingProxyType({'Authorization': API_KEY_PREFIX + row['inference_secret_key']})
+        self.urls = MappingProxyType({path: resolve_proxy_url(self.inference_service, path) for path in ENDPOINT_PATHS})
+
+    def url(self, req_path: str) -> str:
+        return self.urls.get(req_path) or resolve_proxy_url(self.inference_service, req_path)
+
+
+class ModelRoute:
+    """
+    模型的渠道列表，预先按健康状态拆分
+    """
+    __slots__ = ('model', 'channels', 'healthy', 'unhealthy')
+
+    def __init__(self, model: str, rows: list[dict]):
+        self.model = model
+        self.channels: tuple[ChannelRoute, ...] = tuple(ChannelRoute(row, model) for row in rows)
+        self.healthy = tuple(item for item in self.channels if item.health_status)
+        self.unhealthy = tuple(item for item in self.channels if not item.health_status)
+
+    @property
+    def candidates(self) -> tuple[ChannelRoute, ...]:
+        """
+        有健康的渠道时只使用健康的渠道
+        """
+        return self.healthy or self.channels
+
+
+class RoutingTable:
+    """
+    模型 -> 渠道的路由快照，由渠道缓存数据编译生成，只读
+    """
+    __slots__ = ('source', 'routes')
+
+    def __init__(self, source: Optional[dict], routes: dict[str, ModelRoute]):
+        # 生成快照的渠道缓存数据，缓存失效重新加载后会是新的对象
+        self.source = source
+        self.routes = MappingProxyType(routes)
+
+    @classmethod
+    def compile(cls, model_channel_dict: dict[str, list[dict]]) -> 'RoutingTable':
+        routes = {model: ModelRoute(model, rows) for model, rows in model_channel_dict.items() if model}
+        logger.info(f'编译模型路由表，模型数[{len(routes)}]')
+        return cls(model_channel_dict, routes)
+
+    def get(self, model: str) -> Optional[ModelRoute]:
+        return self.routes.get(model)
+
+
+class RoutingTableManager:
+    """
+    持有当前的路由快照，渠道缓存失效（缓存清理事件或过期）后首次访问时重新编译并整体替换
+    进行中的请求继续使用旧快照，不会读到编译到一半的数据
+    """
+
+    def __init__(self):
+        self._table = RoutingTable(None, {})
+
+    async def get(self) -> RoutingTable:
+        model_channel_dict = await channel_curd.query_model_channel_and_cache()
+        table = self._table
+        if table.source is not model_channel_dict:
+            table = self._table = RoutingTable.compile(model_channel_dict)
+        return table
+
+
+routing_tables = RoutingTableManager()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from cachetools import TTLCache
+
+from src.apps.apikey.rsp_schema import ApiKey
+from src.apps.rate_limiter.curd import RateCURD
+from src.common.loggers import logger
+from src.setting import settings
+
+# 用户等级缓存，排队时才需要查询
+_level_cache = TTLCache(maxsize=10000, ttl=60)
+
+
+@dataclass
+class Priority:
+    user_id: str = ''
+    api_key: str = ''
+    level: int = 0
+
+    @property
+    def weight(self) -> float:
+        """
+        调度权重，SCHEDULER_LEVEL_WEIGHTS 未配置的等级按 等级 + 1 计算
+        """
+        conf = settings.SCHEDULER_LEVEL_WEIGHTS
+        try:
+            return max(float(conf.get(str(self.level), self.level + 1)), 0.01)
+        except ValueError:
+            return self.level + 1
+
+
+async def request_priority(api_key_data: Optional[ApiKey]) -> Priority:
+    """
+    请求的调度优先级，由用户等级决定，查询失败时按最低等级
+    """
+    if api_key_data is None:
+        return Priority()
+    user_id = api_key_data.creator
+    level = _level_cache.get(user_id)
+    if level is None:
+        try:
+            level = _level_cache[user_id] = await RateCURD().get_user_level(user_id)
+        except Exception as e:
+            logger.warning(f'查询用户[{user_id}]等级失败: {e}')
+            level = 0
+    return Priority(user_id, api_key_data.id, level)
+
+
+@dataclass(order=True)
+class QueueEntry:
+    finish: float
+    seq: int
+    priority: Priority = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class FairQueue:
+    """
+    加权公平队列（按虚拟完成时间调度）：每个用户按等级权重分配出队份额，
+    同一用户的多个令牌平分该用户的权重，避免单个用户的突发请求或拆分令牌挤占其他用户
+    """
+
+    def __init__(self):
+        self._heap: list[QueueEntry] = []
+        self._seq = itertools.count()
+        # 虚拟时间：最近出队请求的完成时间
+        self._vtime = 0.0
+        # (user_id, api_key) -> 该令牌最后一个排队请求的虚拟完成时间
+        self._finish: dict[tuple[str, str], float] = {}
+        # 排队中的请求数：按令牌、按用户的令牌数
+        self._flow_waiting: Counter = Counter()
+        self._user_flows: Counter = Counter()
+        self.waiting = 0
+
+    def push(self, priority: Priority, future: asyncio.Future):
+        flow = (priority.user_id, priority.api_key)
+        if not self._flow_waiting[flow]:
+            self._user_flows[priority.user_id] += 1
+        self._flow_waiting[flow] += 1
+        self.waiting += 1
+
+        weight = priority.weight / self._user_flows[priority.user_id]
+        start = max(self._vtime, self._finish.get(flow, 0.0))
+        finish = self._finish[flow] = start + 1 / weight
+        heapq.heappush(self._heap, QueueEntry(finish, next(self._seq), priority, future))
+
+    def discard(self, priority: Priority):
+        """
+        请求不再排队（出队、超时或取消）
+        """
+        flow = (priority.user_id, priority.api_key)
+        self._flow_waiting[flow] -= 1
+        self.waiting -= 1
+        if self._flow_waiting[flow] <= 0:
+            del self._flow_waiting[flow]
+            self._user_flows[priority.user_id] -= 1
+            if self._user_flows[priority.user_id] <= 0:
+                del self._user_flows[priority.user_id]
+            # 不再排队的令牌，完成时间落后于虚拟时间后不再影响调度
+            if self._finish.get(flow, 0.0) <= self._vtime:
+                self._finish.pop(flow, None)
+        if not self.waiting:
+            # 队列中剩下的都是已超时、已取消的等待者
+            self._heap.clear()
+            self._finish.clear()
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """
+        取出虚拟完成时间最小的等待者，跳过已超时、已取消的
+        """
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not entry.future.done():
+                self._vtime = entry.finish
+                return entry.future
+        return None
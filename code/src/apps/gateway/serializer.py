@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Union
+
+import orjson
+from starlette.responses import JSONResponse
+
+# 非字符串的 key（如 int）按字符串输出，与 json.dumps 保持一致
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+SSE_PREFIX = b'data: '
+SSE_SUFFIX = b'\n\n'
+# 按字节查找顶层字段时，字段之后最多检查的字节数，超过时完整解析
+MAX_TAIL_BYTES = 4096
+
+
+def dumps(data: Any) -> bytes:
+    """
+    序列化为 utf-8 编码的 json（不转义非 ascii 字符）
+    """
+    return orjson.dumps(data, option=ORJSON_OPTIONS)
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    return orjson.loads(data)
+
+
+def sse_frame(data: Union[dict, str, bytes]) -> bytes:
+    """
+    生成 SSE 数据帧：data: {...}\n\n
+    """
+    if isinstance(data, dict):
+        data = dumps(data)
+    elif isinstance(data, str):
+        data = data.encode('utf-8')
+    return SSE_PREFIX + data + SSE_SUFFIX
+
+
+def _skip_string(content: bytes, pos: int) -> int:
+    """
+    pos 为字符串开头的 '"'，返回字符串结尾的 '"' 的位置
+    """
+    pos += 1
+    while pos < len(content) and content[pos] != 0x22:
+        pos += 2 if content[pos] == 0x5c else 1  # '\\' 转义字符
+    return pos
+
+
+def _object_end(content: bytes, start: int) -> int:
+    """
+    从 start 处的 '{' 开始匹配到对应的 '}'，返回其后一个位置，字符串中的括号不计入
+    """
+    depth, pos, size = 0, start, len(content)
+    while pos < size:
+        char = content[pos]
+        if char == 0x22:  # '"'
+            pos = _skip_string(content, pos)
+        elif char == 0x7b:  # '{'
+            depth += 1
+        elif char == 0x7d:  # '}'
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        pos += 1
+    return -1
+
+
+def _closes_root(content: bytes, pos: int) -> bool:
+    """
+    pos 之后的内容只关闭最外层的对象时，pos 之前的字段是顶层字段
+    """
+    depth = 0
+    while pos < len(content):
+        char = content[pos]
+        if char == 0x22:  # '"'
+            pos = _skip_string(content, pos)
+        elif char in b'{[':
+            depth += 1
+        elif char in b'}]':
+            depth -= 1
+            if depth < 0:
+                return char == 0x7d and not content[pos + 1:].strip()
+        pos += 1
+    return False
+
+
+def extract_field(content: bytes, field: str) -> Any:
+    """
+    从 json 响应中只解析顶层的某个对象字段（如 usage），不解析整个响应
+    字段一般在响应末尾，从后往前查找；找到的字段不是顶层字段（嵌套在其他对象中）、之后的内容过长或结构不符合预期时退回完整解析
+    """
+    key = b'"' + field.encode() + b'"'
+    index = content.rfind(key)
+    # 字符串中的同名内容会被转义为 \"usage\"，跳过
+    while index > 0 and content[index - 1] == 0x5c:
+        index = content.rfind(key, 0, index)
+    if index == -1:
+        return None
+
+    pos = index + len(key)
+    while pos < len(content) and content[pos] in b' \t\r\n:':
+        pos += 1
+    if content.startswith(b'null', pos):
+        end = pos + len(b'null')
+        if len(content) - end <= MAX_TAIL_BYTES and _closes_root(content, end):
+            return None
+    elif content.startswith(b'{', pos):
+        end = _object_end(content, pos)
+        if end != -1 and len(content) - end <= MAX_TAIL_BYTES and _closes_root(content, end):
+            try:
+                return loads(content[pos:end])
+            except orjson.JSONDecodeError:
+                pass
+    data = loads(content)
+    return data.get(field) if isinstance(data, dict) else None
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    使用 orjson 序列化的 json 响应，接口直接返回该对象时可跳过 FastAPI 的 jsonable_encoder
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,10 +1,11 @@
-import json
+import functools
 import re
 import typing
 
 import pydash
 
 from src.apps.gateway.protocol import ChatContentLine, ChatType, empty_chat_response
+from src.apps.gateway.serializer import loads
 from src.common.loggers import logger
 from src.setting import settings
 
@@ -16,25 +17,46 @@ class BaseChatStreamResponseParser:
 
     def __init__(self, chunk_size: int = 1024):
         self.chunk_size = chunk_size
-        self._buffer = b''
+        # received bytes and the read offset of the first unparsed byte, consumed bytes are dropped once per chunk
+        self._buffer = bytearray()
+        self._offset = 0
         self.is_finish = False
         self.has_parsed = False
-        self.tool_arg = {}
+        # tool call index -> whether any arguments have been received
+        self.tool_arg: dict[int, bool] = {}
 
-        self.reasoning_content = ''
-        self.content = ''
+        # content parts, joined lazily only when needed (disconnect accounting)
+        self._reasoning_parts: list[str] = []
+        self._content_parts: list[str] = []
+
+    @property
+    def reasoning_content(self) -> str:
+        return ''.join(self._reasoning_parts)
+
+    @property
+    def content(self) -> str:
+        return ''.join(self._content_parts)
+
+    def _compact(self):
+        """
+        Drop the consumed bytes, only the incomplete tail event is moved.
+        """
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
 
     async def process_buffer(self) -> typing.AsyncIterator[ChatContentLine]:
         """
         Process the buffer and yield parsed data.
         """
         while True:
-            index = self._buffer.find(b'\n\n')
-            if index == -1:
+            end = self._buffer.find(b'\n\n', self._offset)
+            if end == -1:
+                self._compact()
                 break
 
-            part_b, self._buffer = self._buffer[:index + 2], self._buffer[index + 2:]
-            part_s = part_b.decode('utf-8').strip()
+            part_s = self._buffer[self._offset:end].decode('utf-8').strip()
+            self._offset = end + 2
 
             if not part_s.startswith('data:'):
                 yield ChatContentLine(content=part_s)
@@ -46,7 +68,7 @@ class BaseChatStreamResponseParser:
                     yield ChatContentLine(content=part_data, type_=ChatType.Done)
                 else:
                     try:
-                        part_json = json.loads(part_data)
+                        part_json = loads(part_data)
                         choices = part_json.get("choices")
 
                         if choices:
@@ -60,9 +82,11 @@ class BaseChatStreamResponseParser:
                                 # 调整数据信息（reasoning_content）
                                 self.convert_data(delta)
 
-                                # 拼接推理内容（统计需要）
-                                self.reasoning_content += (delta.get('reasoning_content') or '')
-                                self.content += (delta.get('content') or '')
+                                # 记录推理内容（统计需要）
+                                if delta.get('reasoning_content'):
+                                    self._reasoning_parts.append(delta['reasoning_content'])
+                                if delta.get('content'):
+                                    self._content_parts.append(delta['content'])
 
                                 # 处理 tool_calls 里面 arguments 问题
                                 tool_calls = delta.get("tool_calls") or []
@@ -70,13 +94,12 @@ class BaseChatStreamResponseParser:
                                     _function = tool_call.get('function')
                                     if not _function:
                                         continue
-                                    if tool_call['index'] not in self.tool_arg:
-                                        self.tool_arg[tool_call['index']] = ''
-                                    self.tool_arg[tool_call['index']] += _function.get('arguments') or ''
+                                    has_arg = self.tool_arg.get(tool_call['index'], False)
+                                    self.tool_arg[tool_call['index']] = has_arg or bool(_function.get('arguments'))
 
-                        for index, argument in self.tool_arg.items():
-                            if not argument and self.is_finish:
-                                self.tool_arg[index] = ' {}'
+                        for index, has_arg in self.tool_arg.items():
+                            if not has_arg and self.is_finish:
+                                self.tool_arg[index] = True
                                 func_trunk: dict[str, any] = pydash.pick(part_json, ['id', 'object', 'created', 'model'])
                                 func_trunk['choices'] = [
                                     {"index": 0,
@@ -99,9 +122,28 @@ class BaseChatStreamResponseParser:
             self._buffer += chunk
             async for parsed_data in self.process_buffer():
                 yield parsed_data
-        if self._buffer:
-            yield ChatContentLine(content=empty_chat_response(self._buffer.decode('utf-8')), type_=ChatType.Error)
+        if len(self._buffer) > self._offset:
+            rest = self._buffer[self._offset:].decode('utf-8')
+            yield ChatContentLine(content=empty_chat_response(rest), type_=ChatType.Error)
 
+    def reset(self):
+        """
+        Drop all parsed state, used when the stream is re-dispatched to another channel.
+        """
+        self.__init__(self.chunk_size)
+
+    @property
+    def content_length(self) -> int:
+        """
+        Length of the received content, for logging.
+        """
+        return len(self.reasoning_content) + len(self.content)
+
+    def completion_tokens(self, encoder) -> int:
+        """
+        Count the completion tokens received so far (used when the client disconnects).
+        """
+        return len(encoder.encode_ordinary(self.reasoning_content + self.content))
 
     def convert_data(self, choices):
         pass
@@ -139,11 +181,119 @@ class ThinkChatStreamResponseParser(BaseChatStreamResponseParser):
             delta["content"] = content
 
 
-def get_parser(model_name: str, chunk_size: int = 1024) -> BaseChatStreamResponseParser:
+def has_value(data: bytes, key: bytes) -> bool:
+    """
+    Cheap byte search for a JSON key whose value is not null.
+    """
+    start = data.find(key)
+    while start != -1:
+        pos = start + len(key)
+        while pos < len(data) and data[pos] in b' \t:':
+            pos += 1
+        if not data.startswith(b'null', pos):
+            return True
+        start = data.find(key, pos)
+    return False
+
+
+class PassthroughChatStreamResponseParser(BaseChatStreamResponseParser):
+    """
+    Forward the upstream SSE bytes as-is.
+    Only the events carrying a non-null finish_reason / usage are parsed, all the others are located by byte search.
+    """
+
+    def __init__(self, chunk_size: int = 1024):
+        super().__init__(chunk_size)
+        # forwarded regions, decoded only when the client disconnects (disconnect accounting)
+        self._regions: list[bytes] = []
+        self._decoded = 0
+        self.received_bytes = 0
+
+    async def process_buffer(self) -> typing.AsyncIterator[ChatContentLine]:
+        """
+        Forward every complete event in the buffer.
+        """
+        end = self._buffer.rfind(b'\n\n')
+        if end == -1:
+            return
+
+        region = bytes(self._buffer[:end + 2])
+        del self._buffer[:end + 2]
+        self.received_bytes += len(region)
+        self._regions.append(region)
+        if not has_value(region, b'"finish_reason"') and not has_value(region, b'"usage"'):
+            yield ChatContentLine(content=region)
+            return
+
+        # the final events: parse only the lines carrying finish_reason / usage
+        for event in region.split(b'\n\n')[:-1]:
+            part_b = event + b'\n\n'
+            if not has_value(event, b'"finish_reason"') and not has_value(event, b'"usage"'):
+                yield ChatContentLine(content=part_b)
+                continue
+
+            part_s = event.strip()
+            if not part_s.startswith(b'data:'):
+                yield ChatContentLine(content=part_b)
+                continue
+            try:
+                part_json = loads(part_s[5:])
+                for choice in part_json.get("choices") or []:
+                    if choice.get("finish_reason", ""):
+                        self.is_finish = True
+                type_ = ChatType.Usage if self.is_finish and part_json.get("usage") else ChatType.Text
+                yield ChatContentLine(content=part_b, data=part_json, type_=type_)
+            except Exception as e:
+                logger.exception(f"Error parsing: {part_s}")
+                yield ChatContentLine(content=part_b, type_=ChatType.Error, data={"error": str(e)})
+
+    def _decode_regions(self):
+        """
+        Extract the delta content / reasoning_content of the forwarded events not decoded yet.
+        """
+        regions, self._decoded = self._regions[self._decoded:], len(self._regions)
+        for event in b''.join(regions).split(b'\n\n'):
+            event = event.strip()
+            if not event.startswith(b'data:') or event[5:].strip() == b'[DONE]':
+                continue
+            try:
+                part_json = loads(event[5:])
+            except Exception:  # noqa
+                continue
+            for choice in part_json.get("choices") or []:
+                delta = choice.get("delta") or {}
+                if delta.get('reasoning_content'):
+                    self._reasoning_parts.append(delta['reasoning_content'])
+                if delta.get('content'):
+                    self._content_parts.append(delta['content'])
+
+    @property
+    def content_length(self) -> int:
+        return self.received_bytes
+
+    def completion_tokens(self, encoder) -> int:
+        """
+        Decode the forwarded events only when needed, called in the token counting executor.
+        """
+        self._decode_regions()
+        return super().completion_tokens(encoder)
+
+
+@functools.lru_cache(maxsize=1024)
+def is_think_model(model_name: str) -> bool:
+    """
+    Whether the model matches THINK_MODELS, its reasoning content needs to be split out of the content.
+    """
+    return any(re.match(rf'^{expr}$', model_name) for expr in settings.THINK_MODELS.split(','))
+
+
+def get_parser(model_name: str, chunk_size: int = 1024, passthrough: bool = False) -> BaseChatStreamResponseParser:
     """
     Get the parser instance by name.
+    Models that need no rewriting use the passthrough parser when `passthrough` is set.
     """
-    for expr in settings.THINK_MODELS.split(','):
-        if re.match(rf'^{expr}$', model_name):
-            return ThinkChatStreamResponseParser(chunk_size=chunk_size)
+    if is_think_model(model_name):
+        return ThinkChatStreamResponseParser(chunk_size=chunk_size)
+    if passthrough:
+        return PassthroughChatStreamResponseParser(chunk_size=chunk_size)
     return BaseChatStreamResponseParser(chunk_size=chunk_size)
\ No newline at end of file
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import tiktoken
+from cachetools import LRUCache
+
+from src.setting import settings
+
+token_encoder = tiktoken.get_encoding("o200k_base")
+
+# token 计算是 CPU 密集操作，放到有界线程池中执行，避免阻塞事件循环
+_executor = ThreadPoolExecutor(max_workers=settings.TOKEN_COUNT_WORKERS, thread_name_prefix='token-counter')
+
+# 提示词 token 数缓存，key 为 messages 的哈希
+_prompt_cache = LRUCache(maxsize=settings.PROMPT_TOKEN_CACHE_SIZE)
+_prompt_lock = threading.Lock()
+
+
+def content_text(content) -> str:
+    """
+    提取消息内容中的文本，兼容结构化内容（[{"type": "text", "text": "..."}, {"type": "image_url", ...}]）
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return ''.join(part.get('text') or '' for part in content if isinstance(part, dict) and part.get('type') == 'text')
+    return ''
+
+
+def _prompt_text(body: dict) -> str:
+    if 'messages' in body:
+        return ''.join(content_text(message.get('content')) for message in body.get('messages') or [])
+    prompt = body.get('prompt')
+    return ''.join(prompt) if isinstance(prompt, list) and all(isinstance(p, str) for p in prompt) else content_text(prompt)
+
+
+def _count_prompt_tokens(body: dict) -> int:
+    payload = body.get('messages') if 'messages' in body else body.get('prompt')
+    key = hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+    with _prompt_lock:
+        count = _prompt_cache.get(key)
+    if count is None:
+        count = len(token_encoder.encode_ordinary(_prompt_text(body)))
+        with _prompt_lock:
+            _prompt_cache[key] = count
+    return count
+
+
+async def count_in_executor(func: Callable, *args):
+    """
+    在 token 计算线程池中执行
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def count_prompt_tokens(body: dict) -> int:
+    """
+    计算请求中提示词的 token 数（chat 的 messages 或 completions 的 prompt），结果按内容哈希缓存
+    """
+    return await count_in_executor(_count_prompt_tokens, body)
@@ -4,12 +4,12 @@ import datetime
 import httpx
 import pydash
 
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter, Gauge, Histogram
 from src.system.integrations.logging.opensearch_client import opensearch_client
 
 from src.apps.base_curd import BaseCURD
 from src.apps.metrics.req_schema import ApiMetricsQuery, ApiModelTokenMetricsQuery, ApiUserTokenMetricsQuery
-from src.apps.metrics.schema import BaseApiInvokeInfo, ApiInvokeInfoBuilder
+from src.apps.metrics.schema import BaseApiInvokeInfo, ApiInvokeInfoBuilder, ChatApiInvokeInfo
 from src.common.const.comm_const import UserPlat, MetricsAggrType
 from src.common.const.err_const import Err
 from src.common.context import Context
@@ -18,6 +18,9 @@ from src.common.loggers import logger
 from src.setting import settings
 from src.system.interface import qingcloud_user
 
+# prefix cache 命中率按 token 数指数衰减累计，越新的请求权重越高
+PREFIX_CACHE_DECAY = 0.98
+
 
 class MetricsCURD(BaseCURD):
     def __init__(self):
@@ -28,6 +31,41 @@ class MetricsCURD(BaseCURD):
                                     ['channel_id', 'model'])
         self.imaas_api_error = Counter('imaas_api_error', 'IMAAS API Error For LLM Service',
                                        ['model', 'channel_id', 'user_id', 'api_key', 'err', 'stream'])
+        self.imaas_api_retry = Counter('imaas_api_retry', 'IMAAS API Upstream Retry Attempts',
+                                       ['model', 'channel_id', 'outcome'])
+        self.imaas_api_retry_cost = Histogram('imaas_api_retry_cost_seconds', 'IMAAS API Latency Added By Retries',
+                                              ['model', 'outcome'],
+                                              buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+        self.circuit_state = Gauge('channel_circuit_state', 'Channel Circuit Breaker State (0 closed, 1 open, 2 half-open)',
+                                   ['channel_id'])
+        self.response_cache = Counter('response_cache_requests', 'Chat Response Cache Lookups', ['model', 'result'])
+        self.embedding_batch_requests = Histogram('embedding_batch_requests', 'Embedding Requests Per Upstream Batch',
+                                                  ['model'], buckets=(1, 2, 4, 8, 16, 32, 64))
+        self.embedding_batch_inputs = Histogram('embedding_batch_inputs', 'Embedding Inputs Per Upstream Batch',
+                                                ['model'], buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.embedding_cache = Counter('embedding_cache_inputs', 'Embedding Cache Lookups Per Input', ['model', 'result'])
+        self.embedding_cache_tokens = Counter('embedding_cache_tokens', 'Embedding Tokens Served From Cache', ['model'])
+        self.prefix_cache_ratio = Gauge('prefix_cache_hit_ratio', 'Upstream Prefix Cache Hit Ratio (Cached / Prompt Tokens)',
+                                        ['model', 'channel_id'])
+        # (model, channel_id) -> [衰减累计的命中 token 数, 衰减累计的提示词 token 数]
+        self._prefix_cache_tokens: dict[tuple[str, str], list[float]] = {}
+        self.channel_queue_depth = Gauge('channel_queue_depth', 'Requests Waiting For Channel Concurrency Slot',
+                                         ['channel_id'])
+        self.channel_queue_wait = Histogram('channel_queue_wait_seconds', 'Channel Admission Queue Wait Time',
+                                            ['channel_id'],
+                                            buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+        self.channel_rejected = Counter('channel_admission_rejected', 'Requests Rejected By Channel Admission',
+                                        ['channel_id', 'reason'])
+        self.scheduler_queue_depth = Gauge('scheduler_queue_depth', 'Requests Waiting For Channel Slot By User Level',
+                                           ['priority'])
+        self.scheduler_queue_wait = Histogram('scheduler_queue_wait_seconds', 'Queued Request Wait Time By User Level',
+                                              ['priority'],
+                                              buckets=(.005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+        self.upstream_pool_conn = Gauge('upstream_pool_connections', 'Upstream Connection Pool Occupancy',
+                                        ['channel_id', 'state'])
+        self.upstream_pool_wait = Histogram('upstream_pool_wait_seconds', 'Upstream Connection Pool Wait Time',
+                                            ['channel_id'],
+                                            buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
 
     @staticmethod
     def find_latest_metric_val(labels: dict[str, str]) -> int:
@@ -64,12 +102,87 @@ class MetricsCURD(BaseCURD):
                 mount += self.find_latest_metric_val(labels)
             metrics.inc(mount)
 
+    def submit_prefix_cache(self, api_invoke_info: BaseApiInvokeInfo):
+        """
+        按模型、渠道统计上游 prefix cache 命中率，命中网关响应缓存的请求不统计
+        """
+        if not isinstance(api_invoke_info, ChatApiInvokeInfo) or api_invoke_info.cached:
+            return
+        # 上报时 prompt_tokens 已扣除 cached_tokens
+        prompt_tokens = api_invoke_info.prompt_tokens + api_invoke_info.cached_tokens
+        if not prompt_tokens:
+            return
+        key = (api_invoke_info.model, api_invoke_info.channel_id)
+        tokens = self._prefix_cache_tokens.setdefault(key, [0.0, 0.0])
+        tokens[0] = tokens[0] * PREFIX_CACHE_DECAY + api_invoke_info.cached_tokens
+        tokens[1] = tokens[1] * PREFIX_CACHE_DECAY + prompt_tokens
+        self.prefix_cache_ratio.labels(model=key[0], channel_id=key[1]).set(tokens[0] / tokens[1])
+
     def submit_api_error(self, labels):
         self.imaas_api_error.labels(**labels).inc(1)
 
+    def submit_api_retry(self, model: str, channel_id: str, outcome: str, retry_cost: float):
+        """
+        上报换渠道重试的结果：retry 失败后重试、failed 最终失败、recovered 重试后成功
+        """
+        self.imaas_api_retry.labels(model=model, channel_id=channel_id, outcome=outcome).inc(1)
+        self.imaas_api_retry_cost.labels(model=model, outcome=outcome).observe(retry_cost)
+
     def submit_channel_health(self, channel_id: str, model: str, health: int):
         self.channel_health.labels(channel_id=channel_id, model=model).set(health)
 
+    def submit_circuit_state(self, channel_id: str, state: int):
+        self.circuit_state.labels(channel_id=channel_id).set(state)
+
+    def submit_response_cache(self, model: str, result: str):
+        """
+        响应缓存查询结果：memory、redis 命中，或 miss
+        """
+        self.response_cache.labels(model=model, result=result).inc(1)
+
+    def submit_embedding_batch(self, model: str, requests: int, inputs: int):
+        """
+        embeddings 合并后单次上游调用包含的请求数、输入数
+        """
+        self.embedding_batch_requests.labels(model=model).observe(requests)
+        self.embedding_batch_inputs.labels(model=model).observe(inputs)
+
+    def submit_embedding_cache(self, model: str, memory: int, redis: int, miss: int, cached_tokens: int):
+        """
+        embedding 缓存按输入统计的命中情况，以及命中缓存（未计费）的 token 数
+        """
+        for result, count in (('memory', memory), ('redis', redis), ('miss', miss)):
+            if count:
+                self.embedding_cache.labels(model=model, result=result).inc(count)
+        if cached_tokens:
+            self.embedding_cache_tokens.labels(model=model).inc(cached_tokens)
+
+    def submit_channel_queue(self, channel_id: str, depth: int):
+        self.channel_queue_depth.labels(channel_id=channel_id).set(depth)
+
+    def submit_channel_queue_wait(self, channel_id: str, wait_time: float):
+        self.channel_queue_wait.labels(channel_id=channel_id).observe(wait_time)
+
+    def submit_channel_rejected(self, channel_id: str, reason: str):
+        """
+        渠道准入拒绝：queue_full 排队已满、timeout 排队超时
+        """
+        self.channel_rejected.labels(channel_id=channel_id, reason=reason).inc(1)
+
+    def submit_scheduler_queue(self, priority: int, depth: int):
+        self.scheduler_queue_depth.labels(priority=priority).set(depth)
+
+    def submit_scheduler_wait(self, priority: int, wait_time: float):
+        self.scheduler_queue_wait.labels(priority=priority).observe(wait_time)
+
+    def submit_upstream_pool(self, channel_id: str, active: int, idle: int, max_conn: int):
+        self.upstream_pool_conn.labels(channel_id=channel_id, state='active').set(active)
+        self.upstream_pool_conn.labels(channel_id=channel_id, state='idle').set(idle)
+        self.upstream_pool_conn.labels(channel_id=channel_id, state='max').set(max_conn)
+
+    def submit_upstream_pool_wait(self, channel_id: str, wait_time: float):
+        self.upstream_pool_wait.labels(channel_id=channel_id).observe(wait_time)
+
     async def query_api_metrics(self, query_params: ApiMetricsQuery):
         """
         查询接口调用消耗量（token、count、seconds 等）
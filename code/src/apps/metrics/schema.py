@@ -19,6 +19,7 @@ class BaseApiInvokeInfo:
     cost_time: float  # 耗时(秒)
     trace_id: str = ''
     cache_key: str = ''
+    cached: int = 0  # 是否命中响应缓存
 
     def token_type_mount(self):
         raise MaaSBaseException(Err.NOT_IMPLEMENT)
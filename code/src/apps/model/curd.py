@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import pydash
 from cachetools import TTLCache
+from sqlmodel import select
 
 from src.apps.channel.curd import channel_curd
 from src.apps.model.req_schema import ModelQueryReq, ModelSaveReq
@@ -12,11 +13,12 @@ from src.common.dto import User
 from src.common.event_manage import EvictEventSubscriber, EventManager, Event
 from src.common.asyncache import cached
 from src.common.const.comm_const import TTLTime, ResourceModule, EventAction, ModelStatus
-from src.apps.base_curd import BaseCURD
+from src.apps.base_curd import BaseCURD, AsyncBaseCURD
 from src.apps.model.rsp_schema import *
 from src.common.exceptions import MaaSBaseException
 from src.common.utils.data import uuid
 from src.setting import settings
+from src.system.db.async_db import async_session_manage
 from src.system.db.sync_db import session_manage
 from src.system.integrations.aicp import aicp_client
 
@@ -188,7 +190,7 @@ model_curd = ModelCURD()
 model_tag_curd = ModelTagCURD()
 
 
-class ModelParamCURD(BaseCURD[ModelParam]):
+class ModelParamCURD(AsyncBaseCURD[ModelParam]):
 
     @session_manage()
     async def get_by_model_tag(self, model_tag_id: str) -> list[ModelParam]:
@@ -217,26 +219,30 @@ class ModelParamCURD(BaseCURD[ModelParam]):
 
     @cached(cache=TTLCache(maxsize=1024, ttl=TTLTime.MODEL_PARAM.value),
             evict=EvictEventSubscriber(module=ResourceModule.PARAM))
+    @async_session_manage()
     async def get_by_model_name(self, model_name: str, tag_id: str="txt2txt") -> dict[str, ModelParam]:
         """
-        根据 name 查询所有数据
+        根据 name 查询所有数据（网关链路，使用异步 session）
         :param model_name: 要查询的model_name
         :param tag_id: 要查询的tag_id
         :return: 匹配名称的所有数据的列表
         """
-        # 使用 SQLAlchemy 的 filter 方法根据 model id 查询所有匹配的数据
         model_param = []
-        model_list = await model_curd.get_by_model_name(model_name)
-        if model_list is None or len(model_list) < 1:
+        model_ids = (await self.async_session.exec(select(Model.id).where(Model.name == model_name))).all()
+        if not model_ids:
             return {}
-        for model in model_list:
-            model_param_list = await model_param_curd.get_by_model_id_and_tag_id(model.id, tag_id)
-            if model_param_list is not None and len(model_param_list) > 0:
+        default_param_list = None
+        for model_id in model_ids:
+            model_param_list = (await self.async_session.exec(
+                select(self.ModelT).where(self.ModelT.model_id == model_id, self.ModelT.tag_id == tag_id))).all()
+            if model_param_list:
                 model_param.extend(model_param_list)
             else:
-                model_param_list = await model_param_curd.get_by_model_tag(tag_id)
-                if model_param_list is not None and len(model_param_list) > 0:
-                    model_param.extend(model_param_list)
-        return {item.key: item  for item in model_param}
+                # 模型没有单独配置时使用该类型的默认参数
+                if default_param_list is None:
+                    default_param_list = (await self.async_session.exec(
+                        select(self.ModelT).where(self.ModelT.tag_id == tag_id, self.ModelT.model_id.is_(None)))).all()
+                model_param.extend(default_param_list)
+        return {item.key: item for item in model_param}
 
 model_param_curd = ModelParamCURD()
@@ -12,7 +12,7 @@ from src.apps.rate_limiter.schema import DEFAULT_MODEL_NAME, Level, LevelBase, R
     UserRateLimits
 from src.apps.rate_limiter.utils import get_rpm_limit_key_by_level_and_model, get_tpm_limit_key_by_level_and_model, get_user_level_key
 from src.system.db.sync_db import session_manage
-from src.system.integrations.cache.redis_client import redis_client
+from src.system.integrations.cache.redis_client import redis_client, async_redis_client
 
 
 class UserLevelCURD(BaseCURD[UserLevel]):
@@ -111,8 +111,8 @@ class RateCURD(BaseCURD):
     @session_manage()
     async def get_user_level(self, user_id) -> int:
         user_level_key = get_user_level_key(user_id)
-        if (user_level := redis_client.get(user_level_key)) is not None:
-            redis_client.expire(user_level_key, ex=3600)
+        if (user_level := await async_redis_client.get(user_level_key)) is not None:
+            await async_redis_client.expire(user_level_key, ex=3600)
             return int(user_level)
 
         user_stmt = select(UserLevel).where(UserLevel.user_id == user_id)
@@ -123,7 +123,7 @@ class RateCURD(BaseCURD):
             self.session.add(user)
             self.session.commit()
             self.session.refresh(user)
-        redis_client.set(user_level_key, user.level, ex=3600)
+        await async_redis_client.set(user_level_key, user.level, ex=3600)
         return user.level
 
     @session_manage()
@@ -9,7 +9,7 @@ from src.apps.rate_limiter.utils import get_rmp_limit_buckets_key, get_rpm_limit
     get_tpm_limit_key_by_level_and_model, get_tpm_limit_scan_prefix
 from src.common.loggers import logger
 from src.setting import settings
-from src.system.integrations.cache.redis_client import redis_client
+from src.system.integrations.cache.redis_client import redis_client, async_redis_client
 
 RPM_LUA_SCRIPT = """
     local window_start_time = ARGV[1] - (ARGV[3] * 1000)
@@ -34,6 +34,8 @@ class Limiter:
 
     def __init__(self):
         self.redis = redis_client
+        # 请求链路上使用异步客户端，避免阻塞事件循环
+        self.aredis = async_redis_client
         self.window_size = 60  # unit: second
         self.window_size_ms = self.window_size * 1000
 
@@ -78,10 +80,10 @@ class Limiter:
         rate_curd = RateCURD()
         user_level = await rate_curd.get_user_level(user_id)
         # search model limit of level
-        if (limit := self.redis.get(get_rpm_limit_key_by_level_and_model(user_level, model_name))) is not None:
+        if (limit := await self.aredis.get(get_rpm_limit_key_by_level_and_model(user_level, model_name))) is not None:
             return int(limit)
         # search default limit of level
-        if (limit := self.redis.get(get_rpm_limit_key_by_level_and_model(user_level, DEFAULT_MODEL_NAME))) is not None:
+        if (limit := await self.aredis.get(get_rpm_limit_key_by_level_and_model(user_level, DEFAULT_MODEL_NAME))) is not None:
             return int(limit)
 
         # if not model match, search user limit in pg
@@ -103,7 +105,7 @@ class Limiter:
 
         rmp_limit_buckets_key = f"imaas:{get_rmp_limit_buckets_key(user_id, model_name)}"
 
-        result = self.redis.conn.eval(
+        result = await self.aredis.conn.eval(
             RPM_LUA_SCRIPT, 1, rmp_limit_buckets_key, str(int(time.time() * 1000)), str(limit), str(self.window_size))
         return result == 1
 
@@ -111,7 +113,7 @@ class Limiter:
         """
         更新用户请求限流
         """
-        self.redis.set(get_rpm_limit_key_by_level_and_model(user_level, model_name), limit, ex=None)
+        await self.aredis.set(get_rpm_limit_key_by_level_and_model(user_level, model_name), limit, ex=None)
 
     async def get_tpm_limit(self, user_id, model_name) -> int:
         """
@@ -119,10 +121,10 @@ class Limiter:
         """
         rate_curd = RateCURD()
         user_level = await rate_curd.get_user_level(user_id)
-        if (limit := self.redis.get(get_tpm_limit_key_by_level_and_model(user_level, model_name))) is not None:
+        if (limit := await self.aredis.get(get_tpm_limit_key_by_level_and_model(user_level, model_name))) is not None:
             return limit
 
-        if (limit := self.redis.get(get_tpm_limit_key_by_level_and_model(user_level, DEFAULT_MODEL_NAME))) is not None:
+        if (limit := await self.aredis.get(get_tpm_limit_key_by_level_and_model(user_level, DEFAULT_MODEL_NAME))) is not None:
             return limit
 
         user_limit = await RateCURD().get_level_model_limit(user_level, model_name)
@@ -139,8 +141,8 @@ class Limiter:
         设置用户token使用量
         """
         key = get_tpm_limit_buckets_key(user_id, model_name)
-        self.redis.zincrby(key, int(time.time() * 1000), token_usage)
-        self.redis.expire(key, 3600)
+        await self.aredis.zincrby(key, int(time.time() * 1000), token_usage)
+        await self.aredis.expire(key, 3600)
 
     async def check_tpm_limit(self, user_id, model_name) -> bool:
         """
@@ -156,24 +158,29 @@ class Limiter:
         current_time_ms = int(time.time() * 1000)
         total_token_usage = 0
         cursor = 0
-        cursor, data = self.redis.zscan(tpm_limit_buckets_key, cursor=cursor)
+        cursor, data = await self.aredis.zscan(tpm_limit_buckets_key, cursor=cursor)
 
+        expired_members = []
         for member, score in data:
             timestamp = int(member)  # 解析时间戳
 
-            # 删除过期的记录
+            # 过期的记录
             if timestamp < current_time_ms - self.window_size_ms:
-                self.redis.zrem(tpm_limit_buckets_key, member)  # 删除过期的数据
+                expired_members.append(member)
             else:
                 total_token_usage += float(score)  # 累加未过期的 Token 使用量
 
+        # 一次性删除过期的数据
+        if expired_members:
+            await self.aredis.zrem(tpm_limit_buckets_key, *expired_members)
+
         return int(total_token_usage) < int(limit)
 
     async def update_tpm_limit(self, level, model_name, limit: int):
         """
         更新用户token限流
         """
-        self.redis.set(get_tpm_limit_key_by_level_and_model(level, model_name), limit, ex=None)
+        await self.aredis.set(get_tpm_limit_key_by_level_and_model(level, model_name), limit, ex=None)
 
     async def check_rpm_and_tpm_limit(self, user_id, model_name) -> bool:
         """
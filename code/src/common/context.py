@@ -4,6 +4,7 @@ from contextvars import ContextVar
 from typing import Optional
 
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.common.dto import EMPTY_USER, User
 
@@ -19,6 +20,9 @@ class Context:
     # 上下文中 session，生命周期为 session_manage 装饰器内部
     THREAD_SESSION: ContextVar[Optional[Session]] = ContextVar("thread_session", default=None)
 
+    # 上下文中异步 session，生命周期为 async_session_manage 装饰器内部
+    ASYNC_SESSION: ContextVar[Optional[AsyncSession]] = ContextVar("async_session", default=None)
+
     # 接口调用请求 trace_id
     TRACE_ID: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
 
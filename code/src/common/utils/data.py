@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 import base64
-import copy
 import hashlib
 import hmac
 import random
@@ -187,8 +186,9 @@ def count_characters(s):
 
 
 def replace_model(body: dict, proxy_model) -> dict:
+    """
+    替换请求中的 model，只做浅拷贝，嵌套数据（如 base64 图片）与原请求共享，调用方不能修改嵌套数据
+    """
     if not body or 'model' not in body:
         return body
-    new_body = copy.deepcopy(body)
-    new_body['model'] = proxy_model
-    return new_body
+    return {**body, 'model': proxy_model}
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 from typing import Union
 
 from pydantic import BaseSettings, validator
@@ -17,6 +18,8 @@ class Settings(BaseSettings):
 
     # Database
     DB_CONNECTION_STR: str = ""
+    # 异步连接串（asyncpg），为空时由 DB_CONNECTION_STR 转换
+    DB_ASYNC_CONNECTION_STR: str = ""
     DB_POOL_SIZE: int = 5
     DB_MAX_OVERFLOW: int = 10
     DB_POOL_RECYCLE: int = 3600
@@ -28,6 +31,7 @@ class Settings(BaseSettings):
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = ""
     REDIS_PREFIX: str = "imaas:"
+    REDIS_MAX_CONNECTIONS: int = 100
 
     # redis 过期时间(秒)
     EXP_TIME_BAL_ENOUGH = 480
@@ -39,8 +43,89 @@ class Settings(BaseSettings):
     HEALTH_CHECK_INTERVAL = 5
     HEALTH_CHANGE_THRESHOLD = 2
     THINK_MODELS = "DeepSeek-R1.*,QwQ-32B,Qwen3.*"
+    # 客户端断开时计算 token 的线程数，以及提示词 token 数缓存条数
+    TOKEN_COUNT_WORKERS: int = 4
+    PROMPT_TOKEN_CACHE_SIZE: int = 4096
+    # 非流式接口（对话、embeddings、rerank）直接返回上游响应数据，只提取 usage，思考模型仍需完整解析
+    UPSTREAM_RAW_PASSTHROUGH: bool = True
+    # 对话响应缓存：请求头 x-imaas-cache: on 开启，或对 RESPONSE_CACHE_MODELS 中的模型（逗号分隔，支持正则）
+    # 在 temperature=0 或指定 seed 时开启；过期时间（秒）、进程内缓存总大小、单条缓存大小上限（字节）
+    RESPONSE_CACHE_MODELS: str = ""
+    RESPONSE_CACHE_TTL: int = 3600
+    RESPONSE_CACHE_MEMORY_BYTES: int = 256 * 1024 * 1024
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    RESPONSE_CACHE_REDIS: bool = True
+    # embeddings 请求合并（开启后每个请求最多多等待一个合并窗口，只合并同一令牌的请求）：合并窗口（毫秒）、单次上游调用的最大输入数
+    EMBEDDING_BATCH_ENABLE: bool = False
+    EMBEDDING_BATCH_WINDOW_MS: int = 5
+    EMBEDDING_BATCH_MAX_INPUTS: int = 64
+    # embedding 按文本缓存：开启的模型（逗号分隔，支持正则）、过期时间（秒）、进程内缓存总大小（字节）
+    EMBEDDING_CACHE_MODELS: str = ""
+    EMBEDDING_CACHE_TTL: int = 7 * 24 * 3600
+    EMBEDDING_CACHE_MEMORY_BYTES: int = 256 * 1024 * 1024
+    EMBEDDING_CACHE_REDIS: bool = True
+    # rerank 分片：文档数超过单片上限时拆分为多个分片，分散到模型的健康渠道并发调用；分片数上限、超时时间（秒）
+    RERANK_SHARD_SIZE: int = 256
+    RERANK_MAX_SHARDS: int = 8
+    RERANK_TIMEOUT: int = 30
+    # 语音接口上传的音频边读边转发到上游，单次请求体大小上限（字节）
+    AUDIO_UPLOAD_MAX_BYTES: int = 200 * 1024 * 1024
+    # 长音频分段并发识别，请求参数 long_audio=true 时开启，仅支持 16bit 的 WAV/PCM
+    # 分段时长、在分段末尾向前查找静音的范围、找不到静音时相邻分段的重叠时长（秒），低于该音量（dBFS）视为静音
+    ASR_SEGMENT_SECONDS: int = 60
+    ASR_SEGMENT_SEARCH_SECONDS: float = 10
+    ASR_SEGMENT_OVERLAP_SECONDS: float = 1
+    ASR_SILENCE_DBFS: float = -40
+    ASR_SEGMENT_TIMEOUT: int = 120
+    # 长文本语音合成：输入超过该字符数时按句子切分，分散到模型的健康渠道并发合成，按顺序流式返回，为 0 时不切分
+    TTS_SEGMENT_CHARS: int = 300
+    # 对话接口使用 pydantic 完整校验请求参数，默认只校验网关用到的字段
+    GATEWAY_STRICT_VALIDATION: bool = False
+    # 非思考模型的流式响应直接透传上游数据，不做解析和重新序列化
+    STREAM_PASSTHROUGH: bool = True
     PROXY_SERVER_HOST = ""
 
+    # 推理服务连接池（按渠道复用长连接）
+    UPSTREAM_MAX_CONNECTIONS: int = 200
+    UPSTREAM_MAX_KEEPALIVE: int = 50
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 60
+    UPSTREAM_HTTP2: bool = False
+    UPSTREAM_DNS_CACHE_TTL: int = 60
+    # 按 inference_service 覆盖连接池配置，json 格式，如：{"http://svc:8000": {"max_connections": 500, "http2": true}}
+    UPSTREAM_POOL_CONF: Union[str, dict] = {}
+    # 渠道选择策略：hash（按 api key 一致性哈希固定渠道）、random、least_outstanding（进行中请求最少）、p2c_ewma（TTFT 均值加权的二选一）、
+    # prefix_affinity（按提示词前缀固定渠道，提高上游 KV cache 命中率）
+    ROUTING_STRATEGY: str = 'hash'
+    # 按模型配置渠道选择策略，key 支持正则，如：DeepSeek-R1.*:p2c_ewma,bge-m3:least_outstanding
+    ROUTING_MODEL_STRATEGY: Union[str, dict] = {}
+    ROUTING_EWMA_ALPHA: float = 0.3
+    # 一致性哈希：每个渠道的虚拟节点数、负载上限系数（渠道进行中请求数不超过平均值的倍数，超过时顺延到下一个渠道）
+    ROUTING_HASH_VNODES: int = 160
+    ROUTING_HASH_LOAD_FACTOR: float = 1.25
+    # prefix_affinity 策略取提示词（system prompt + 前几轮对话）的前多少个字符计算哈希
+    ROUTING_PREFIX_CHARS: int = 1024
+    # 渠道并发准入（渠道配置了 max_concurrency 时生效）：单个渠道每个进程的最大排队数、排队超时时间（秒）、
+    # 集群并发租约的过期时间（秒，持有期间每 1/3 过期时间续期一次，进程退出后未释放的租约过期后清理）、等待集群租约的轮询间隔（秒）
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 10
+    ADMISSION_LEASE_SECONDS: int = 60
+    ADMISSION_POLL_INTERVAL: float = 0.05
+    # 渠道排队时按用户等级加权公平调度，等级权重，如：0:1,1:2,2:4，未配置的等级权重为 等级 + 1
+    SCHEDULER_LEVEL_WEIGHTS: Union[str, dict] = {}
+    # 上游调用失败时换渠道重试：单次请求最多尝试次数（含首次），以及重试可以在本次调用超时时间之外额外占用的时间（秒）
+    UPSTREAM_MAX_ATTEMPTS: int = 2
+    UPSTREAM_RETRY_DEADLINE: int = 60
+    # 渠道熔断：根据真实请求的结果（超时、网络异常、5xx）判断，统计窗口（秒）内请求数达到下限且错误率超过阈值，
+    # 或连续失败次数超过阈值时熔断；熔断时长（秒）按连续熔断次数指数退避，半开状态的探测请求超时（秒）后重新放行探测
+    BREAKER_ENABLE: bool = True
+    BREAKER_WINDOW: int = 10
+    BREAKER_MIN_REQUESTS: int = 10
+    BREAKER_ERROR_RATE: float = 0.5
+    BREAKER_CONSECUTIVE_FAILURES: int = 5
+    BREAKER_OPEN_SECONDS: float = 5
+    BREAKER_MAX_OPEN_SECONDS: float = 120
+    BREAKER_PROBE_TIMEOUT: float = 30
+
     # qingcloud
     QINGCLOUD_ACCESS_KEY_ID: str = ""
     QINGCLOUD_SECRET_ACCESS_KEY: str = ""
@@ -82,7 +167,7 @@ class Settings(BaseSettings):
     FILE_RETENTION_DAYS = 30  # 文件保留天数
     FILE_CLEANUP_CRON = '0 0 * * *'  # 文件清理任务，每天凌晨0点0分0秒执行一次
 
-    @validator('ACCOUNT_MAPPING', pre=True)
+    @validator('ACCOUNT_MAPPING', 'ROUTING_MODEL_STRATEGY', 'SCHEDULER_LEVEL_WEIGHTS', pre=True)
     def parse_dict(cls, value):
         mapping_dict = {}
         if value:
@@ -92,6 +177,12 @@ class Settings(BaseSettings):
                     mapping_dict[map_arr[0]] = map_arr[1]
         return mapping_dict
 
+    @validator('UPSTREAM_POOL_CONF', pre=True)
+    def parse_json_dict(cls, value):
+        if isinstance(value, str):
+            return json.loads(value) if value else {}
+        return value
+
     # CUSTOM_PROD=('[{"model": "Qwen2-7B-Instruct", "model_category": "qwen", "token_type": "input", "price": 0.8, "unit": "token", "model_description": "无计费"},'
     #              '{"model": "Qwen2-7B-Instruct", "model_category": "qwen", "token_type": "output", "price": 1.2, "unit": "token", "model_description": "无计费"},'
     #              '{"model": "CosyVoice-300M", "model_category": "qwen", "token_type": "output", "price": 0.007, "unit": "seconds", "model_description": "无计费"},'
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from typing import Callable, Dict
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.common.context import Context
+from src.setting import settings
+
+
+def _async_connection_str() -> str:
+    """
+    未单独配置异步连接串时，复用同步连接串并替换为 asyncpg 驱动
+    """
+    if settings.DB_ASYNC_CONNECTION_STR:
+        return settings.DB_ASYNC_CONNECTION_STR
+    return make_url(settings.DB_CONNECTION_STR).set(drivername='postgresql+asyncpg').render_as_string(hide_password=False)
+
+
+async_engine: AsyncEngine = create_async_engine(
+    _async_connection_str(),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO,
+)
+
+
+async_session_maker: Callable[..., AsyncSession] = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+def async_session_manage(commit_on_exit=True):
+    """
+    异步 session 管理，事务传播逻辑与 session_manage 一致
+    """
+    def decorator(func):
+        async def wrapper(self, *args, **kwargs):
+
+            # 事务传播，有 session 直接用，没有 session 才开启
+            if Context.ASYNC_SESSION.get():
+                return await func(self, *args, **kwargs)
+            async with AsyncSessionWrapper(commit_on_exit=commit_on_exit):
+                return await func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class AsyncSessionWrapper:
+    def __init__(self, session_args: Dict = None, commit_on_exit=True):
+        self.token = None
+        self.session_args = session_args or {}
+        self.commit_on_exit = commit_on_exit
+
+    @classmethod
+    def session(cls) -> AsyncSession:
+        return Context.ASYNC_SESSION.get()
+
+    async def __aenter__(self):
+        self.token = Context.ASYNC_SESSION.set(async_session_maker(**self.session_args))
+        return type(self)
+
+    async def __aexit__(self, exc_type, *_):
+        """
+        退出时自动处理事务，如果有报错，自动回滚。如果没有报错自动提交。完成后回收 sess 和协程变量
+        :param exc_type: 不为 None 时代表有错误
+        :param _:
+        :return: 有错误时返回 False，继续抛出异常
+        """
+        sess = Context.ASYNC_SESSION.get()
+        try:
+            if exc_type is not None:
+                await sess.rollback()
+            elif self.commit_on_exit:
+                await sess.commit()
+        finally:
+            await sess.close()
+            Context.ASYNC_SESSION.reset(self.token)
+
+        # 如果出现异常，回收资源后再次抛出
+        return exc_type is None
+
+
+async def close_async_engine():
+    await async_engine.dispose()
@@ -1,4 +1,5 @@
 -- CREATE DATABASE imaas WITH OWNER = aicp ENCODING = 'UTF8';
+-- 已有数据库升级时执行 upgrade.sql
 
 create table public.model
 (
@@ -24,11 +25,15 @@ create table public.channel
     model_redirection    varchar,
     inference_secret_key varchar                             not null,
     inference_service    varchar                             not null,
+    max_concurrency      integer   default 0                 not null,
+    weight               integer   default 1                 not null,
     update_time          timestamp default CURRENT_TIMESTAMP not null,
     create_time          timestamp default CURRENT_TIMESTAMP not null,
     status               status_enum                         not null
 );
 alter table public.channel owner to aicp;
+comment on column public.channel.max_concurrency is '集群内最大并发请求数，0 表示不限制';
+comment on column public.channel.weight is '容量权重，按权重分配流量';
 
 create table public.channel_type
 (
@@ -0,0 +1,7 @@
+-- 已有数据库的升级脚本，可重复执行；新建数据库使用 create.sql 即可
+
+-- 渠道并发准入与容量权重（部署新版本前执行，否则查询渠道时缺少字段）
+alter table public.channel add column if not exists max_concurrency integer default 0 not null;
+alter table public.channel add column if not exists weight integer default 1 not null;
+comment on column public.channel.max_concurrency is '集群内最大并发请求数，0 表示不限制';
+comment on column public.channel.weight is '容量权重，按权重分配流量';
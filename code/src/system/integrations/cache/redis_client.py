@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
-from typing import Iterator, Union
+from typing import Iterator, Union, Optional
 
 import redis
+import redis.asyncio
 from redis.typing import PatternT
 
 from src.common.loggers import logger
@@ -105,4 +106,76 @@ class RedisClient:
         return self.conn.zrem(f"{self.prefix}{name}", *values)
 
 
+class AsyncRedisClient:
+    """
+    异步 redis 客户端，共享连接池，供请求链路（事件循环）中使用
+    线程中运行的消费者、定时任务仍使用同步的 RedisClient
+    """
+
+    def __init__(self):
+        self.prefix = settings.REDIS_PREFIX
+        self.pool = redis.asyncio.ConnectionPool(host=settings.REDIS_HOST, password=settings.REDIS_PASSWORD,
+                                                 port=settings.REDIS_PORT, decode_responses=True,
+                                                 max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.conn = redis.asyncio.StrictRedis(connection_pool=self.pool)
+        # 二进制数据（如 embedding 向量）使用单独的连接池，不做解码
+        self.bytes_pool = redis.asyncio.ConnectionPool(host=settings.REDIS_HOST, password=settings.REDIS_PASSWORD,
+                                                       port=settings.REDIS_PORT, decode_responses=False,
+                                                       max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.bytes_conn = redis.asyncio.StrictRedis(connection_pool=self.bytes_pool)
+        self._scripts = {}
+
+    async def set(self, key, value, nx=False, ex=60):
+        return await self.conn.set(f"{self.prefix}{key}", value, nx=nx, ex=ex)
+
+    async def get(self, key):
+        return await self.conn.get(f"{self.prefix}{key}")
+
+    async def delete(self, key):
+        return await self.conn.delete(f"{self.prefix}{key}")
+
+    async def expire(self, key, ex):
+        return await self.conn.expire(f"{self.prefix}{key}", ex)
+
+    async def mget_bytes(self, keys: list[str]) -> list[Optional[bytes]]:
+        return await self.bytes_conn.mget([f"{self.prefix}{key}" for key in keys])
+
+    async def mset_bytes(self, data: dict[str, bytes], ex=60):
+        async with self.bytes_conn.pipeline(transaction=False) as pipe:
+            for key, value in data.items():
+                pipe.set(f"{self.prefix}{key}", value, ex=ex)
+            await pipe.execute()
+
+    async def zincrby(self, name, key, val):
+        return await self.conn.zincrby(f'{self.prefix}{name}', val, key)
+
+    async def zscan(self, name, cursor=0, match=None, count=None):
+        return await self.conn.zscan(f"{self.prefix}{name}", cursor, match, count)
+
+    async def zrem(self, name, *values):
+        return await self.conn.zrem(f"{self.prefix}{name}", *values)
+
+    async def eval_script(self, script: str, keys: list[str], args: list):
+        """
+        执行 lua 脚本，脚本注册后通过 evalsha 调用
+        """
+        if script not in self._scripts:
+            self._scripts[script] = self.conn.register_script(script)
+        return await self._scripts[script](keys=[f"{self.prefix}{key}" for key in keys], args=args)
+
+    async def product_msg(self, queue: str, data: dict, max_len=settings.API_EVENT_QUEUE_MAX_LEN):
+        """
+        生产数据推送到队列中
+        """
+        queue = f'{self.prefix}{queue}'
+        return await self.conn.xadd(queue, data, maxlen=max_len)
+
+    async def close(self):
+        await self.conn.aclose()
+        await self.pool.disconnect()
+        await self.bytes_conn.aclose()
+        await self.bytes_pool.disconnect()
+
+
 redis_client = RedisClient()
+async_redis_client = AsyncRedisClient()
@@ -36,6 +36,7 @@ def consume_api_event():
                 # 往 prometheus 的 metrics 写数据
                 api_invoke_info: BaseApiInvokeInfo = ApiInvokeInfoBuilder.build(data)
                 metrics_curd.submit_token(api_invoke_info)
+                metrics_curd.submit_prefix_cache(api_invoke_info)
                 # 往 redis 的待计费写数据
                 if settings.BILLING_ENABLE:
                     token_type_mount = api_invoke_info.token_type_mount()
@@ -73,8 +74,15 @@ def consume_api_error_event():
                 continue
             logger.info(f'队列[{API_ERROR_EVENT_QUEUE}]消费事件数[{len(messages)}]')
             for msg_id, data in messages:
-                labels = pydash.pick(data, ['model', 'channel_id', 'user_id', 'api_key', 'err', 'stream'])
-                metrics_curd.submit_api_error(labels)
+                outcome = data.get('outcome')
+                if outcome != 'recovered':
+                    labels = pydash.pick(data, ['model', 'channel_id', 'user_id', 'api_key', 'err', 'stream'])
+                    metrics_curd.submit_api_error(labels)
+                # 重试相关的调用：失败后重试、重试后成功，以及重试后仍然失败
+                if outcome == 'retry' or int(data.get('attempt') or 1) > 1:
+                    retry_cost = data.get('retry_cost') if outcome == 'recovered' else data.get('cost_time')
+                    metrics_curd.submit_api_retry(data.get('model'), data.get('channel_id'), outcome,
+                                                  float(retry_cost or 0))
             redis_client.ack_msg(API_ERROR_EVENT_QUEUE, API_CONSUME_GROUP, [msg_id for msg_id, _ in messages])
         except Exception as e:
             logger.error(f'从队列[{API_INVOKE_EVENT_QUEUE}]中消费失败：', e)